@@ -1,11 +1,158 @@
-from concurrent.futures import Future, ThreadPoolExecutor
-from flask import render_template
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from flask import abort, current_app, g, has_request_context, render_template, request
+from os import environ
+from threading import Condition, Thread, local
+from time import monotonic
+
+#every page shares the same threads, and one page can only use a few of them at a time
+workers = int(environ.get('PROMISE_WORKERS', 16))
+workers_per_request = int(environ.get('PROMISE_WORKERS_PER_REQUEST', 4))
+#seconds to wait for the queries of a page before giving up on it, zero means no limit
+deadline = float(environ.get('PROMISE_DEADLINE', 0))
+
+worker_state = local()
+
+class Promise(Future):
+    def __init__(self, group, fn, args, kwargs):
+        super().__init__()
+        self.group = group
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        if not self.set_running_or_notify_cancel():
+            return
+        try:
+            self.set_result(self.fn(*self.args, **self.kwargs))
+        except BaseException as e:
+            self.set_exception(e)
+        finally:
+            self.fn = self.args = self.kwargs = None #let go of the DB object and its connection
+
+    def result(self, timeout = None):
+        #a promise that waits for another promise runs it itself if no thread has started it yet, so that the
+        #waiting promises cannot take up every thread
+        if getattr(worker_state, 'active', False) and executor.claim(self):
+            self.run()
+        return super().result(timeout)
+
+class PromiseGroup():
+    def __init__(self):
+        self.pending = deque()
+        self.running = 0
+
+class Executor():
+    def __init__(self, workers, workers_per_request):
+        self.workers = workers
+        self.workers_per_request = workers_per_request
+        self.groups = deque() #groups that have pending promises, in the order that they will be served
+        self.condition = Condition()
+        self.running = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.timeouts = 0
+        for i in range(workers):
+            Thread(target=self.work, daemon=True).start()
+
+    def submit(self, group, promise):
+        with self.condition:
+            if not group.pending:
+                self.groups.append(group)
+            group.pending.append(promise)
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            self.condition.notify()
+
+    def claim(self, promise):
+        with self.condition:
+            group = promise.group
+            if not group or promise not in group.pending:
+                return False
+            group.pending.remove(promise)
+            if not group.pending:
+                self.groups.remove(group)
+            self.queued -= 1
+            return True
+
+    def cancel(self, group):
+        with self.condition:
+            if group.pending:
+                self.groups.remove(group)
+            self.queued -= len(group.pending)
+            self.timeouts += 1
+            while group.pending:
+                group.pending.popleft().cancel()
+
+    def next_promise(self):
+        #take turns between the groups that are not already using all of the threads that they may use
+        for group in self.groups:
+            if group.running < self.workers_per_request:
+                promise = group.pending.popleft()
+                self.groups.remove(group)
+                if group.pending:
+                    self.groups.append(group)
+                group.running += 1
+                self.queued -= 1
+                self.running += 1
+                return promise
+        return None
+
+    def work(self):
+        worker_state.active = True
+        while True:
+            with self.condition:
+                promise = self.next_promise()
+                while not promise:
+                    self.condition.wait()
+                    promise = self.next_promise()
+            promise.run()
+            with self.condition:
+                promise.group.running -= 1
+                self.running -= 1
+                self.condition.notify_all() #the group may be allowed to run another promise now
+
+    def metrics(self):
+        with self.condition:
+            return {
+                'workers': self.workers,
+                'running': self.running,
+                'queued': self.queued,
+                'max_queued': self.max_queued,
+                'timeouts': self.timeouts,
+            }
+
+executor = Executor(workers, workers_per_request)
+
+def get_promise_group():
+    #the promises of a request share its limit, anything else gets a group of its own
+    if not has_request_context():
+        return PromiseGroup()
+    if 'promise_group' not in g:
+        g.promise_group = PromiseGroup()
+    return g.promise_group
 
 def promise(fn):
-    return lambda *args, **kwargs: ThreadPoolExecutor(1).submit(fn, *args, **kwargs)
+    def submit(*args, **kwargs):
+        if getattr(worker_state, 'active', False):
+            #a promise that is made by another promise is needed by it right away
+            ret = Promise(None, fn, args, kwargs)
+            ret.run()
+            return ret
+        ret = Promise(get_promise_group(), fn, args, kwargs)
+        executor.submit(ret.group, ret)
+        return ret
+    return submit
 
 def render_template_async(*args, **kwargs):
-    for key in kwargs:
-        if isinstance(kwargs[key], Future):
-            kwargs[key] = kwargs[key].result()
+    end = monotonic() + deadline if deadline else None
+    try:
+        for key in kwargs:
+            if isinstance(kwargs[key], Future):
+                kwargs[key] = kwargs[key].result(end and max(end - monotonic(), 0))
+    except TimeoutError:
+        executor.cancel(get_promise_group())
+        current_app.logger.warning('Gave up on ' + request.full_path + ': ' + str(executor.metrics()))
+        abort(503)
     return render_template(*args, **kwargs)
@@ -4,11 +4,12 @@ import json
 import gzip
 import re
 import sqlite3
-from asynchelper import promise, render_template_async
+from asynchelper import executor, promise, render_template_async
 from cachelib import FileSystemCache
 from cachelib import NullCache
 from datetime import datetime
 from db import DB
+from db import result_cache
 from flask import Flask
 from flask import Response
 from flask import abort
@@ -28,8 +29,6 @@ cache.clear() #delete the cache when the webserver is restarted
 app.jinja_env.trim_blocks = True
 app.jinja_env.lstrip_blocks = True
 
-clinvar_versions = DB().dates()
-
 #it's necessary to double-escape slashes because WSGI decodes them before passing the URL to Flask
 class SuperEscapedConverter(BaseConverter):
     @staticmethod
@@ -142,111 +141,67 @@ def get_conflict_breakdown(total_variants_in_conflict_by_significance_and_signif
 
     return breakdown
 
+def get_conflict_counts(row, min_conflict_level):
+    counts = {'any_conflict': row['in_conflict_count']}
+    if row['potentially_in_conflict_count']:
+        counts[0] = row['potentially_in_conflict_count'] - counts['any_conflict']
+    if row['count']:
+        counts[-1] = row['count'] - counts[0] - counts['any_conflict']
+    for conflict_level in range(min_conflict_level, 6):
+        count = row['conflict_level' + str(conflict_level) + '_count']
+        if count:
+            counts[conflict_level] = count
+    return counts
+
 @promise
-def get_conflict_summary_by_condition(total_variants_by_condition, total_variants_potentially_in_conflict_by_condition,
-                                      total_variants_in_conflict_by_condition,
-                                      total_variants_in_conflict_by_condition_and_conflict_level):
+def get_conflict_summary_by_condition(total_variants_by_condition_and_conflict_level, min_conflict_level):
     summary = {}
 
-    for row in total_variants_in_conflict_by_condition.result():
-        condition_name = row['condition_name']
-        count = row['count']
-        summary[condition_name] = {'any_conflict': count}
-
-    for row in total_variants_potentially_in_conflict_by_condition.result():
-        condition_name = row['condition_name']
-        if condition_name in summary: #some conditions have no conflicts at all
-            count = row['count']
-            summary[condition_name][0] = count - summary[condition_name]['any_conflict']
-
-    for row in total_variants_by_condition.result():
-        condition_name = row['condition_name']
-        if condition_name in summary: #some conditions have no conflicts at all
-            count = row['count']
-            summary[condition_name][-1] = count - summary[condition_name][0] - summary[condition_name]['any_conflict']
-
-    for row in total_variants_in_conflict_by_condition_and_conflict_level.result():
-        condition_name = row['condition_name']
-        conflict_level = row['conflict_level']
-        count = row['count']
-        summary[condition_name][conflict_level] = count
+    for row in total_variants_by_condition_and_conflict_level.result():
+        if row['in_conflict_count']: #some conditions have no conflicts at all
+            summary[row['condition_name']] = get_conflict_counts(row, min_conflict_level)
 
     return summary
 
 @promise
-def get_conflict_summary_by_gene(total_variants_by_gene, total_variants_potentially_in_conflict_by_gene,
-                                 total_variants_in_conflict_by_gene,
-                                 total_variants_in_conflict_by_gene_and_conflict_level):
+def get_conflict_summary_by_gene(total_variants_by_gene_and_conflict_level, min_conflict_level):
     summary = {}
 
-    for row in total_variants_in_conflict_by_gene.result():
-        gene = row['gene']
-        count = row['count']
-        summary[gene] = {'any_conflict': count}
-
-    for row in total_variants_potentially_in_conflict_by_gene.result():
-        gene = row['gene']
-        if gene in summary: #some genes have no conflicts at all
-            count = row['count']
-            summary[gene][0] = count - summary[gene]['any_conflict']
-
-    for row in total_variants_by_gene.result():
-        gene = row['gene']
-        if gene in summary: #some genes have no conflicts at all
-            count = row['count']
-            summary[gene][-1] = count - summary[gene][0] - summary[gene]['any_conflict']
-
-    for row in total_variants_in_conflict_by_gene_and_conflict_level.result():
-        gene = row['gene']
-        conflict_level = row['conflict_level']
-        count = row['count']
-        summary[gene][conflict_level] = count
+    for row in total_variants_by_gene_and_conflict_level.result():
+        if row['in_conflict_count']: #some genes have no conflicts at all
+            summary[row['gene']] = get_conflict_counts(row, min_conflict_level)
 
     return summary
 
 @promise
-def get_conflict_summary_by_submitter(total_variants_by_submitter, total_variants_potentially_in_conflict_by_submitter,
-                                      total_variants_in_conflict_by_submitter,
-                                      total_variants_in_conflict_by_submitter_and_conflict_level):
+def get_conflict_summary_by_submitter(total_variants_by_submitter_and_conflict_level, min_conflict_level):
     summary = {}
 
-    for row in total_variants_in_conflict_by_submitter.result():
-        submitter_id = row['submitter_id']
-        submitter_name = row['submitter_name']
-        count = row['count']
-        summary[submitter_id] = {'name': submitter_name, 'any_conflict': count}
-
-    for row in total_variants_potentially_in_conflict_by_submitter.result():
-        submitter_id = row['submitter_id']
-        if submitter_id in summary: #some submitters have no conflicts with anyone
-            count = row['count']
-            summary[submitter_id][0] = count - summary[submitter_id]['any_conflict']
-
-    for row in total_variants_by_submitter.result():
-        submitter_id = row['submitter_id']
-        if submitter_id in summary: #some submitters have no conflicts with anyone
-            count = row['count']
-            summary[submitter_id][-1] = count - summary[submitter_id][0] - summary[submitter_id]['any_conflict']
-
-    for row in total_variants_in_conflict_by_submitter_and_conflict_level.result():
-        submitter_id = row['submitter_id']
-        conflict_level = row['conflict_level']
-        count = row['count']
-        summary[submitter_id][conflict_level] = count
+    for row in total_variants_by_submitter_and_conflict_level.result():
+        if row['in_conflict_count']: #some submitters have no conflicts with anyone
+            summary[row['submitter_id']] = {
+                'name': row['submitter_name'],
+                **get_conflict_counts(row, min_conflict_level),
+            }
 
     return summary
 
 @promise
-def get_conflict_overview(total_variants_in_conflict_by_conflict_level):
+def get_conflict_overview(total_variants_by_conflict_level, min_conflict_level):
     overview = {}
 
-    for row in total_variants_in_conflict_by_conflict_level.result():
-        conflict_level = row['conflict_level']
-        count = row['count']
-        overview[conflict_level] = count
+    row = total_variants_by_conflict_level.result()[0]
+    for conflict_level in range(min_conflict_level, 6):
+        count = row['conflict_level' + str(conflict_level) + '_count']
+        if count:
+            overview[conflict_level] = count
 
     return overview
 
+@promise
+def get_total(total_variants_by_conflict_level, column):
+    return total_variants_by_conflict_level.result()[0][column]
+
 @promise
 def get_graph_data_for_submissions_by_normalized_method(total_submissions_by_normalized_method_over_time):
     rows = total_submissions_by_normalized_method_over_time.result()
@@ -428,7 +383,7 @@ def template_functions():
         return tagline
 
     def dates():
-        return clinvar_versions
+        return DB().dates()
 
     def gene_tagline(gene_info, link_base):
         if not gene_info['see_also']:
@@ -525,9 +480,13 @@ def template_functions():
         'variant_link': variant_link,
     }
 
+#pages are cached for the latest release at the time, so a new release is never shown with the pages of an old one
+def cache_key():
+    return str(DB().max_date()) + ' ' + request.url
+
 @app.before_request
 def cache_get():
-    response = cache.get(request.url)
+    response = cache.get(cache_key())
     if not response or 'gzip' not in request.accept_encodings:
         return None
 
@@ -540,13 +499,13 @@ def cache_get():
 
 @app.after_request
 def cache_set(response):
-    if (ttl >= 0 and not cache.has(request.url) and response.status_code == 200 and not response.direct_passthrough and
-            'gzip' in request.accept_encodings):
+    if (ttl >= 0 and not cache.has(cache_key()) and response.status_code == 200 and not response.direct_passthrough and
+            not response.cache_control.no_store and 'gzip' in request.accept_encodings):
         response.set_data(gzip.compress(response.get_data()))
         response.set_etag(sha256(response.get_data()).hexdigest())
         response.headers.set('Content-Encoding', 'gzip')
         response.freeze()
-        cache.set(request.url, response, timeout=ttl)
+        cache.set(cache_key(), response, timeout=ttl)
     return response
 
 @app.route('/variants-in-conflict-by-condition')
@@ -565,42 +524,24 @@ def variants_in_conflict_by_condition(condition_name = None):
 
     if condition_name == None:
         args['condition1_name'] = list_arg('conditions')
+        totals = DB().total_variants_by_conflict_level(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-condition.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
+            overview=get_conflict_overview(totals, min_conflict_level),
+            total_variants=get_total(totals, 'count'),
+            total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
+            total_variants_in_conflict=get_total(totals, 'in_conflict_count'),
             summary=get_conflict_summary_by_condition(
-                DB().total_variants_by_condition(
-                    **args
-                ),
-                DB().total_variants_by_condition(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_condition(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_condition_and_conflict_level(
+                DB().total_variants_by_conflict_level(
+                    'condition',
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                min_conflict_level,
             ),
         )
 
@@ -609,24 +550,18 @@ def variants_in_conflict_by_condition(condition_name = None):
     args['condition1_name'] = condition_name
     args['original_terms'] = request.args.get('original_terms')
 
+    totals = DB().total_variants_by_conflict_level(
+        min_conflict_level=min_conflict_level,
+        **args
+    )
     return render_template_async(
         'variants-in-conflict-by-condition--condition.html',
         condition_name=condition_name,
         condition_xrefs=DB().condition_xrefs(condition_name, args['date']),
         min_conflict_level=min_conflict_level,
-        overview=get_conflict_overview(
-            DB().total_variants_in_conflict_by_conflict_level(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-        ),
-        total_variants=DB().total_variants(
-            **args
-        ),
-        total_variants_potentially_in_conflict=DB().total_variants(
-            min_conflict_level=0,
-            **args
-        ),
+        overview=get_conflict_overview(totals, min_conflict_level),
+        total_variants=get_total(totals, 'count'),
+        total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
         breakdown=get_conflict_breakdown(
             DB().total_variants_in_conflict_by_significance_and_significance(
                 min_conflict_level=min_conflict_level,
@@ -634,21 +569,12 @@ def variants_in_conflict_by_condition(condition_name = None):
             )
         ),
         summary=get_conflict_summary_by_condition(
-            DB().total_variants_by_condition(
-                **args
-            ),
-            DB().total_variants_by_condition(
-                min_conflict_level=0,
-                **args
-            ),
-            DB().total_variants_by_condition(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-            DB().total_variants_in_conflict_by_condition_and_conflict_level(
+            DB().total_variants_by_conflict_level(
+                'condition',
                 min_conflict_level=min_conflict_level,
                 **args
             ),
+            min_conflict_level,
         ),
         variants=DB().variants(
             min_conflict_level=min_conflict_level,
@@ -674,42 +600,24 @@ def variants_in_conflict_by_gene(gene = None, significance1 = None, significance
 
     if not gene:
         args['gene'] = list_arg('genes')
+        totals = DB().total_variants_by_conflict_level(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-gene.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
+            overview=get_conflict_overview(totals, min_conflict_level),
+            total_variants=get_total(totals, 'count'),
+            total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
+            total_variants_in_conflict=get_total(totals, 'in_conflict_count'),
             summary=get_conflict_summary_by_gene(
-                DB().total_variants_by_gene(
-                    **args
-                ),
-                DB().total_variants_by_gene(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_gene(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_gene_and_conflict_level(
+                DB().total_variants_by_conflict_level(
+                    'gene',
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                min_conflict_level,
             ),
         )
 
@@ -722,23 +630,17 @@ def variants_in_conflict_by_gene(gene = None, significance1 = None, significance
     args['original_terms'] = request.args.get('original_terms')
 
     if not significance1:
+        totals = DB().total_variants_by_conflict_level(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-gene--gene.html',
             gene_info=gene_info,
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
+            overview=get_conflict_overview(totals, min_conflict_level),
+            total_variants=get_total(totals, 'count'),
+            total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
                     min_conflict_level=min_conflict_level,
@@ -781,25 +683,17 @@ def variants_in_conflict_by_significance(significance1 = None, significance2 = N
     min_conflict_level = max(1, int_arg('min_conflict_level'))
 
     if not significance2:
+        totals = DB().total_variants_by_conflict_level(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-significance.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
+            overview=get_conflict_overview(totals, 1),
+            total_variants=get_total(totals, 'count'),
+            total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
+            total_variants_in_conflict=get_total(totals, 'in_conflict_count'),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
                     min_conflict_level=min_conflict_level,
@@ -842,42 +736,24 @@ def variants_in_conflict_by_submitter(submitter1_id = None, submitter2_id = None
 
     if submitter1_id == None:
         args['submitter1_id'] = list_arg('submitters')
+        totals = DB().total_variants_by_conflict_level(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-submitter.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
+            overview=get_conflict_overview(totals, min_conflict_level),
+            total_variants=get_total(totals, 'count'),
+            total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
+            total_variants_in_conflict=get_total(totals, 'in_conflict_count'),
             summary=get_conflict_summary_by_submitter(
-                DB().total_variants_by_submitter(
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_submitter_and_conflict_level(
+                DB().total_variants_by_conflict_level(
+                    'submitter',
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                min_conflict_level,
             ),
         )
 
@@ -888,44 +764,26 @@ def variants_in_conflict_by_submitter(submitter1_id = None, submitter2_id = None
     args['original_terms'] = request.args.get('original_terms')
 
     if submitter2_id == None:
+        totals = DB().total_variants_by_conflict_level(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-submitter--1submitter.html',
             submitter1_info=submitter1_info,
             submitter1_primary_method=DB().submitter_primary_method(submitter1_id, args['date']),
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
+            overview=get_conflict_overview(totals, min_conflict_level),
+            total_variants=get_total(totals, 'count'),
+            total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
+            total_variants_in_conflict=get_total(totals, 'in_conflict_count'),
             summary=get_conflict_summary_by_submitter(
-                DB().total_variants_by_submitter(
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_submitter_and_conflict_level(
+                DB().total_variants_by_conflict_level(
+                    'submitter',
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                min_conflict_level,
             ),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
@@ -948,24 +806,18 @@ def variants_in_conflict_by_submitter(submitter1_id = None, submitter2_id = None
     args['submitter2_id'] = submitter2_id
 
     if not significance1:
+        totals = DB().total_variants_by_conflict_level(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-submitter--2submitters.html',
             submitter1_info=submitter1_info,
             submitter2_info=submitter2_info,
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
+            overview=get_conflict_overview(totals, min_conflict_level),
+            total_variants=get_total(totals, 'count'),
+            total_variants_potentially_in_conflict=get_total(totals, 'potentially_in_conflict_count'),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
                     min_conflict_level=min_conflict_level,
@@ -1065,6 +917,15 @@ def significance_terms():
         max_date=DB().max_date(),
     )
 
+#how the shared query results and the promise threads are holding up, which is never cached
+@app.route('/status')
+def status():
+    return Response(
+        json.dumps({'result_cache': result_cache.metrics(), 'executor': executor.metrics()}),
+        mimetype='application/json',
+        headers={'Cache-Control': 'no-store'},
+    )
+
 @app.route('/submissions-by-variant/<superescaped:variant_name>')
 def submissions_by_variant(variant_name):
     args = {
@@ -1362,7 +1223,7 @@ def variants_by_mondo_condition(mondo_condition_id = None, gene = None, signific
         abort(404)
     mondo_name = DB().mondo_name(mondo_condition_id, args['date'])
     clinvar_names = DB().clinvar_names_from_mondo_id(mondo_condition_id, args['date'])
-    args['condition1_name'] = clinvar_names
+    args['mondo_id'] = mondo_condition_id
     args['original_terms'] = request.args.get('original_terms')
 
     if significance == None and gene == None and submitter_id == None:
@@ -7,59 +7,92 @@ def create_index(cursor, table, columns):
     columns = ','.join(columns)
     cursor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})')
 
-db = __import__('import-clinvar-xml').connect()
-cursor = db.cursor()
+import dbhelper
 
 submission_columns_to_index = [
+    'variant_name',
     'rsid',
     'gene',
+    'gene_type',
     'normalized_gene',
+    'normalized_gene_type',
     'rcv',
     'scv',
     'submitter_id',
     'submitter_name',
     'submitter_country_code',
     'significance',
+    'normalized_significance',
     'condition_name',
     'method',
+    'normalized_method',
+]
+#the text columns are stored as keys into their dimension tables
+submission_columns_to_index = [
+    column + '_id' if column in dbhelper.dimension_tables else column for column in submission_columns_to_index
 ]
-create_index(cursor, 'submissions', ['date'])
-for column in submission_columns_to_index:
-    create_index(cursor, 'submissions', [column])
-    create_index(cursor, 'submissions', ['date', column])
 
+#the pairs have the keys of both of their submissions, so the pages can count and group the pairs of a release at a
+#conflict level and star levels from these indexes alone
 comparison_columns_to_index = [
-    'variant_name',
-    'gene',
+    'variant_name_id',
+    'gene_id',
     'gene_type',
-    'normalized_gene',
+    'normalized_gene_id',
     'normalized_gene_type',
     'submitter1_id',
     'submitter1_country_code',
     'scv1',
-    'significance1',
-    'normalized_significance1',
-    'condition1_name',
-    'method1',
-    'normalized_method1',
+    'significance1_id',
+    'normalized_significance1_id',
+    'condition1_name_id',
+    'method1_id',
+    'normalized_method1_id',
     'submitter2_id',
-    'significance2',
-    'normalized_significance2',
-    'normalized_method2',
-    'condition2_name',
+    'significance2_id',
+    'normalized_significance2_id',
+    'normalized_method2_id',
+    'condition2_name_id',
 ]
-for column in comparison_columns_to_index:
-    create_index(cursor, 'comparisons', ['date', 'conflict_level', 'star_level1', 'star_level2', column])
 
-create_index(cursor, 'mondo_clinvar_relationships', ['mondo_id'])
-
-
-date = list(cursor.execute('SELECT MAX(date) FROM submissions'))[0][0]
-
-
-print('Creating gene links table')
-
-def create_gene_links_table(normalized):
+def create_indexes(cursor):
+    if dbhelper.is_temporal(cursor):
+        #a version is valid at a date if it was valid from that date or earlier, so lookups by date narrow on valid_to
+        create_index(cursor, 'submission_versions', ['valid_to', 'valid_from'])
+        for column in submission_columns_to_index:
+            create_index(cursor, 'submission_versions', [column])
+            create_index(cursor, 'submission_versions', [column, 'valid_to'])
+    else:
+        create_index(cursor, 'encoded_submissions', ['date'])
+        for column in submission_columns_to_index:
+            create_index(cursor, 'encoded_submissions', [column])
+            create_index(cursor, 'encoded_submissions', ['date', column])
+
+    for column in comparison_columns_to_index:
+        create_index(cursor, 'comparison_pairs', ['date', 'conflict_level', 'star_level1', 'star_level2', column])
+    #the conditions of a Mondo term are looked up one by one, before the star levels are compared, and everything the
+    #Mondo pages count and group by is read from the index itself
+    create_index(cursor, 'comparison_pairs', [
+        'date',
+        'condition1_name_id',
+        'conflict_level',
+        'star_level1',
+        'star_level2',
+        'variant_name_id',
+        'submitter1_id',
+        'submitter1_name_id',
+        'gene_id',
+        'normalized_gene_id',
+        'significance1_id',
+        'normalized_significance1_id',
+    ])
+
+    create_index(cursor, 'mondo_clinvar_relationships', ['mondo_id'])
+
+    #give the query planner statistics about the new release
+    cursor.execute('ANALYZE')
+
+def create_gene_links_table(cursor, date, normalized):
     if normalized:
         table = 'normalized_gene_links'
         gene_column = 'normalized_gene'
@@ -73,10 +106,10 @@ def create_gene_links_table(normalized):
 
     cursor.execute('CREATE TABLE ' + table + ' (gene TEXT, see_also TEXT)')
 
-    query = 'SELECT DISTINCT ' + gene_column + ' FROM submissions WHERE ' + type_column + '=2 AND date=?'
+    query = 'SELECT DISTINCT ' + gene_column + ' FROM submissions WHERE ' + type_column + '=2 AND date=? ORDER BY ' + gene_column
     gene_combinations = list(map(lambda row: row[0], cursor.execute(query, [date])))
 
-    query = 'SELECT 1 FROM submissions WHERE ' + gene_column + '=? AND date=?'
+    query = 'SELECT 1 FROM submissions WHERE ' + gene_column + '_id=(SELECT id FROM genes WHERE value=?) AND date=?'
     for gene_combination in gene_combinations:
         for individual_gene in gene_combination.split(', '):
             is_gene = bool(list(cursor.execute(query, [individual_gene, date])))
@@ -88,8 +121,37 @@ def create_gene_links_table(normalized):
 
     cursor.execute('CREATE INDEX ' + table + '__gene ON ' + table + ' (gene)')
 
-create_gene_links_table(True)
-create_gene_links_table(False)
+def create_gene_links_tables(cursor, date):
+    print('Creating gene links table')
+    create_gene_links_table(cursor, date, True)
+    create_gene_links_table(cursor, date, False)
+
+db = dbhelper.connect()
+cursor = db.cursor()
+dbhelper.create_import_state_table(cursor)
+date = list(cursor.execute('SELECT MAX(date) FROM releases'))[0][0]
+
+if dbhelper.is_partitioned(cursor):
+    #index the file of each release, the gene links are only shown for the latest release
+    #(a file that has already been indexed is skipped, so that an interrupted run picks up where it stopped)
+    indexed_dates = set(row[0] for row in cursor.execute('SELECT date FROM import_state WHERE stage=?', ['indexed']))
+    for partition_date, filename in list(cursor.execute('SELECT date, filename FROM partitions')):
+        if partition_date in indexed_dates:
+            continue
+        partition = dbhelper.connect(filename)
+        partition_cursor = partition.cursor()
+        create_indexes(partition_cursor)
+        if partition_date == date:
+            create_gene_links_tables(partition_cursor, date)
+        partition.commit()
+        partition.close()
+        cursor.execute('UPDATE import_state SET stage=? WHERE date=? AND stage=?', ['indexed', partition_date, 'imported'])
+        db.commit()
+else:
+    create_indexes(cursor)
+    create_gene_links_tables(cursor, date)
+    #a release whose import was interrupted is left for --resume to finish
+    cursor.execute('UPDATE import_state SET stage=? WHERE stage=?', ['indexed', 'imported'])
 
 db.commit()
 db.close()
@@ -1,15 +1,202 @@
+import json
 import sqlite3
 from asynchelper import promise
+from collections import OrderedDict
+from os import environ, stat
+from sys import getsizeof
+from threading import Lock
+
+#text columns that are stored as keys into a table of their distinct values
+dimension_tables = {
+    'condition1_name': 'condition_names',
+    'condition2_name': 'condition_names',
+    'gene': 'genes',
+    'method1': 'methods',
+    'normalized_gene': 'genes',
+    'normalized_method1': 'methods',
+    'normalized_method2': 'methods',
+    'normalized_significance1': 'significances',
+    'normalized_significance2': 'significances',
+    'significance1': 'significances',
+    'significance2': 'significances',
+    'variant_name': 'variant_names',
+}
+
+cache_size = -64 * 1024 #KiB
+mmap_size = 1024 * 1024 * 1024
+
+class Connection(sqlite3.Connection):
+    def __init__(self, filename, inode):
+        super().__init__('file:' + filename + '?mode=ro', uri=True, timeout=20, check_same_thread=False, cached_statements=256)
+        self.row_factory = sqlite3.Row
+        self.execute('PRAGMA cache_size=' + str(cache_size))
+        self.execute('PRAGMA mmap_size=' + str(mmap_size))
+        self.execute('PRAGMA query_only=1') #not even temporary tables are written
+        self.inode = inode
+        #each release may be stored in a file of its own, which is attached when a query needs it
+        self.partitioned = bool(list(self.execute("SELECT 1 FROM sqlite_master WHERE name='partitions'")))
+        self.attached_filename = None
+
+class ConnectionPool():
+    def __init__(self, filename, size):
+        self.filename = filename
+        self.size = size
+        self.idle_connections = []
+        self.lock = Lock()
+
+    def get(self):
+        #a new database may have been moved over the old one since a connection was opened
+        inode = stat(self.filename).st_ino
+        with self.lock:
+            while self.idle_connections:
+                connection = self.idle_connections.pop()
+                if connection.inode == inode:
+                    return connection
+                connection.close()
+        return Connection(self.filename, inode)
+
+    def put(self, connection):
+        if connection.in_transaction:
+            connection.rollback() #do not hold a read lock or keep an old snapshot while idle
+        with self.lock:
+            if len(self.idle_connections) < self.size:
+                self.idle_connections.append(connection)
+                return
+        connection.close()
+
+#keep connections open between requests so that their page caches and prepared statements are reused
+connection_pool = ConnectionPool('clinvar.db', int(environ.get('DB_POOL_SIZE', 16)))
+
+def database_generation(filename):
+    #publishing a release changes the database file, and everything that was read from it before is stale then
+    info = stat(filename)
+    return (info.st_ino, info.st_mtime_ns)
+
+def result_size(value):
+    size = getsizeof(value)
+    if type(value) in [list, tuple, sqlite3.Row]:
+        for item in value:
+            size += result_size(item)
+    elif type(value) == dict:
+        for key in value:
+            size += result_size(key) + result_size(value[key])
+    return size
+
+class Catalog():
+    def __init__(self, filename):
+        self.filename = filename
+        self.generation = None
+        self.entries = {}
+        self.lock = Lock()
+
+    def get(self, db, name, load):
+        generation = database_generation(self.filename)
+        with self.lock:
+            if generation != self.generation:
+                self.generation = generation
+                self.entries = {}
+            if name in self.entries:
+                return self.entries[name]
+        value = load()
+        #a connection that was opened before the database was replaced still sees the old contents
+        if db.db.inode == generation[0]:
+            with self.lock:
+                if generation == self.generation:
+                    self.entries[name] = value
+        return value
+
+#the releases and the values that can be filtered on are needed by almost every page, so they are kept in memory and
+#only read again when the database changes
+catalog = Catalog('clinvar.db')
+
+class ResultCache():
+    def __init__(self, filename, budget):
+        self.filename = filename
+        self.budget = budget
+        self.size = 0
+        self.entries = OrderedDict() #least recently used first
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        generation = database_generation(self.filename)
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.size = 0
+                self.generation = generation
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return generation, self.entries[key][0]
+            self.misses += 1
+            return generation, None
+
+    def put(self, generation, key, value):
+        size = result_size(value)
+        if size > self.budget:
+            return
+        with self.lock:
+            if generation != self.generation or key in self.entries:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.budget:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
 
-class DB():
-    def __init__(self):
-        self.db = sqlite3.connect('clinvar.db', timeout=20, check_same_thread=False)
-        self.db.row_factory = sqlite3.Row
-        self.cursor = self.db.cursor()
+#results of the aggregate queries are shared between pages that ask for the same numbers, zero turns this off
+result_cache = ResultCache('clinvar.db', int(float(environ.get('DB_CACHE_SIZE', 128)) * 1024 * 1024))
+
+def cached(fn):
+    def lookup(self, *args, **kwargs):
+        if not result_cache.budget:
+            return fn(self, *args, **kwargs)
+        #a missing date means the latest release of the database file that the cache is tied to
+        key = (
+            fn.__name__,
+            tuple(tuple(arg) if type(arg) == list else arg for arg in args),
+            tuple(sorted(
+                (name, tuple(value) if type(value) == list else value)
+                for name, value in kwargs.items() if value != None
+            )),
+        )
+        generation, value = result_cache.get(key)
+        if value == None:
+            value = fn(self, *args, **kwargs)
+            result_cache.put(generation, key, value)
+        #callers may add to the rows that they are given
+        return list(value) if type(value) == list else value
+    return lookup
 
-    def and_optimized_conflict_level(self):
-        comparison_required = (
-            self.parameters.get('min_conflict_level', -1) > -1 or
+class DB():
+    def __getattr__(self, name):
+        #borrow a connection when the first query is run, usually on a promise thread, and keep it while this object
+        #is in use
+        if name in ['db', 'cursor']:
+            self.db = connection_pool.get()
+            self.cursor = self.db.cursor()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def __del__(self):
+        if 'db' in self.__dict__:
+            connection_pool.put(self.db)
+
+    def comparison_required(self, min_conflict_level):
+        return (
+            min_conflict_level > -1 or
             'normalized_method' in self.parameters or
             'normalized_method2' in self.parameters or
             'normalized_significance2' in self.parameters or
@@ -19,7 +206,13 @@ class DB():
             self.parameters.get('star_level', 0) > 0 or
             self.parameters.get('star_level2', 0) > 0
         )
-        if comparison_required:
+
+    def key_column(self, column):
+        #the text of a column is looked up once for each group when the rows are grouped by its key
+        return column + '_id' if column in dimension_tables else column
+
+    def and_optimized_conflict_level(self):
+        if self.comparison_required(self.parameters.get('min_conflict_level', -1)):
             self.query += ' AND conflict_level>=:min_conflict_level'
         else:
             self.query += ' AND conflict_level=-1'
@@ -29,19 +222,66 @@ class DB():
             if not value:
                 self.query += ' AND FALSE'
                 return
-            db_types = {
-                int: 'INTEGER',
-                str: 'TEXT',
-            }
-            self.cursor.execute('DROP TABLE IF EXISTS ' + column) #the same connection may perform multiple queries
-            self.cursor.execute('CREATE TEMP TABLE ' + column + ' (value ' + db_types[type(value[0])] + ')')
-            self.cursor.execute('CREATE INDEX ' + column + '__value ON ' + column + ' (value)')
-            self.cursor.executemany('INSERT INTO ' + column + ' VALUES (?)', map(lambda value: [value], value))
-            self.query += ' AND ' + column + ' IN (SELECT value FROM ' + column + ')'
+            #the values are bound as a single JSON array, so that no table has to be created for them and the statement
+            #can be reused
+            if column in dimension_tables:
+                self.query += (
+                    ' AND ' + column + '_id IN (SELECT id FROM ' + dimension_tables[column] +
+                    ' WHERE value IN (SELECT value FROM json_each(:' + column + '_values)))'
+                )
+            else:
+                self.query += ' AND ' + column + ' IN (SELECT value FROM json_each(:' + column + '_values))'
+            self.parameters[column + '_values'] = json.dumps(value)
         else:
-            self.query += ' AND ' + column + '=:' + column
+            if column in dimension_tables:
+                self.query += ' AND ' + column + '_id=(SELECT id FROM ' + dimension_tables[column] + ' WHERE value=:' + column + ')'
+            else:
+                self.query += ' AND ' + column + '=:' + column
             self.parameters[column] = value
 
+    def and_mondo_condition(self, mondo_id):
+        #the relationships of each release already list every ClinVar condition under a Mondo condition, including
+        #the conditions under its descendants, so they are joined here instead of passing the names to the query
+        self.query += (
+            ' AND condition1_name_id IN (SELECT condition_names.id FROM mondo_clinvar_relationships' +
+            ' INNER JOIN condition_names ON condition_names.value=clinvar_name WHERE date=:date AND mondo_id=:mondo_id)'
+        )
+        self.parameters['mondo_id'] = mondo_id
+
+    def attach(self, filename):
+        if filename == self.db.attached_filename:
+            return
+        if self.db.in_transaction:
+            self.db.commit() #databases cannot be attached or detached in a transaction
+        if self.db.attached_filename:
+            self.cursor.execute('DETACH DATABASE clinvar_release')
+        self.cursor.execute('ATTACH DATABASE ? AS clinvar_release', ['file:' + filename + '?mode=ro'])
+        self.cursor.execute('PRAGMA clinvar_release.cache_size=' + str(cache_size))
+        self.db.attached_filename = filename
+
+    def use_release(self, date = None):
+        date = date or self.max_date()
+        if self.db.partitioned:
+            #a date without a release is looked up in the latest release and finds nothing
+            filenames = list(self.cursor.execute('SELECT filename FROM partitions WHERE date=?', [date]))
+            if not filenames:
+                filenames = list(self.cursor.execute('SELECT filename FROM partitions ORDER BY date DESC LIMIT 1'))
+            self.attach(filenames[0][0])
+        return date
+
+    def vocabulary(self, name, query):
+        #every value that any release has (the dimension tables also keep the values that a release no longer has after
+        #it is imported again, so the queries only count values that submissions use)
+        return catalog.get(self, name, lambda: set(map(lambda row: row[0], self.history(query))))
+
+    def history(self, query, parameters = []):
+        #queries over every release are run on the file of each release in turn
+        for date in reversed(self.dates()) if self.db.partitioned else [None]:
+            if date:
+                self.use_release(date)
+            for row in self.cursor.execute(query, parameters):
+                yield row
+
     def rows(self):
         return list(self.cursor.execute(self.query, self.parameters))
 
@@ -52,7 +292,7 @@ class DB():
         try:
             self.cursor.execute(
                 'SELECT clinvar_name FROM mondo_clinvar_relationships WHERE mondo_id=? AND date=?',
-                [mondo_id, date or self.max_date()]
+                [mondo_id, self.use_release(date)]
             )
             return [row[0] for row in self.cursor.fetchall()]
         except IndexError:
@@ -62,10 +302,11 @@ class DB():
         try:
             return list(self.cursor.execute(
                 '''
-                    SELECT DISTINCT condition_xrefs FROM submissions WHERE condition_name=? AND date=?
+                    SELECT DISTINCT condition_xrefs FROM submissions
+                    WHERE condition_name_id=(SELECT id FROM condition_names WHERE value=?) AND date=?
                     ORDER BY condition_xrefs=='' /* prefer a row that has cross-references */ LIMIT 1
                 ''',
-                [condition_name, date or self.max_date()]
+                [condition_name, self.use_release(date)]
             ))[0][0].split(';')
         except IndexError:
             return []
@@ -74,22 +315,22 @@ class DB():
         try:
             return list(self.cursor.execute(
                 'SELECT submitter_country_name FROM submissions WHERE submitter_country_code=? AND date=? LIMIT 1',
-                [country_code, date or self.max_date()]
+                [country_code, self.use_release(date)]
             ))[0][0]
         except IndexError:
             return None
 
     def dates(self):
-        return list(map(
+        return list(catalog.get(self, 'dates', lambda: list(map(
             lambda row: row[0],
-            self.cursor.execute('SELECT DISTINCT date FROM submissions ORDER BY date DESC')
-        ))
+            self.cursor.execute('SELECT date FROM releases ORDER BY date DESC')
+        ))))
 
     def gene_from_rsid(self, rsid, date = None):
         try:
             return list(self.cursor.execute(
                 'SELECT DISTINCT gene FROM submissions WHERE rsid=? AND date=? LIMIT 1',
-                [rsid, date or self.max_date()]
+                [rsid, self.use_release(date)]
             ))[0][0]
         except IndexError:
             return None
@@ -97,10 +338,16 @@ class DB():
     def gene_info(self, gene, original_genes, date = None):
         try:
             if original_genes:
-                query = 'SELECT gene_type FROM submissions WHERE gene=? AND date=? LIMIT 1'
+                query = '''
+                    SELECT gene_type FROM submissions
+                    WHERE gene_id=(SELECT id FROM genes WHERE value=?) AND date=? LIMIT 1
+                '''
             else:
-                query = 'SELECT normalized_gene_type FROM submissions WHERE normalized_gene=? AND date=? LIMIT 1'
-            ret = {'name': gene, 'type': list(self.cursor.execute(query, [gene, date or self.max_date()]))[0][0]}
+                query = '''
+                    SELECT normalized_gene_type FROM submissions
+                    WHERE normalized_gene_id=(SELECT id FROM genes WHERE value=?) AND date=? LIMIT 1
+                '''
+            ret = {'name': gene, 'type': list(self.cursor.execute(query, [gene, self.use_release(date)]))[0][0]}
         except IndexError:
             ret = {'name': gene, 'type': 0}
 
@@ -116,62 +363,108 @@ class DB():
         return ret
 
     def is_condition_name(self, condition_name):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE condition_name=? LIMIT 1',
-            [condition_name]
-        )))
+        return condition_name in self.vocabulary(
+            'condition_names',
+            '''
+                SELECT value FROM condition_names
+                WHERE EXISTS (SELECT 1 FROM submissions WHERE condition_name_id=condition_names.id)
+            '''
+        )
 
     def is_date(self, date):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE date=? LIMIT 1',
-            [date]
-        )))
+        return date in self.dates()
 
     def is_gene(self, gene):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE gene=? OR normalized_gene=? LIMIT 1',
-            [gene, gene]
-        )))
+        #original and normalized genes share the table of genes
+        return gene in self.vocabulary(
+            'genes',
+            '''
+                SELECT value FROM genes
+                WHERE EXISTS (SELECT 1 FROM submissions WHERE gene_id=genes.id)
+                OR EXISTS (SELECT 1 FROM submissions WHERE normalized_gene_id=genes.id)
+            '''
+        )
 
     def is_method(self, method):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE method=? OR normalized_method=? LIMIT 1',
-            [method, method]
-        )))
+        #original and normalized methods share the table of methods
+        return method in self.vocabulary(
+            'methods',
+            '''
+                SELECT value FROM methods
+                WHERE EXISTS (SELECT 1 FROM submissions WHERE method_id=methods.id)
+                OR EXISTS (SELECT 1 FROM submissions WHERE normalized_method_id=methods.id)
+            '''
+        )
 
     def is_mondo_condition_id(self, mondo_condition_id):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM mondo_clinvar_relationships WHERE mondo_id=? LIMIT 1',
-            [mondo_condition_id]
-        )))
+        return mondo_condition_id in self.vocabulary(
+            'mondo_condition_ids',
+            'SELECT DISTINCT mondo_id FROM mondo_clinvar_relationships'
+        )
 
     def is_significance(self, significance):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE significance=? LIMIT 1',
-            [significance]
-        )))
+        #the table of significances also has the normalized terms, which only count if they were also submitted as is
+        return significance in self.vocabulary(
+            'significances',
+            '''
+                SELECT value FROM significances
+                WHERE EXISTS (SELECT 1 FROM submissions WHERE significance_id=significances.id)
+            '''
+        )
 
     def is_submitter_id(self, submitter_id):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE submitter_id=? LIMIT 1',
-            [submitter_id]
-        )))
+        #skip from one submitter to the next through the index instead of reading every submission
+        return submitter_id in self.vocabulary(
+            'submitter_ids',
+            '''
+                WITH RECURSIVE submitter_ids(id) AS (
+                    SELECT MIN(submitter_id) FROM submissions
+                    UNION ALL
+                    SELECT (SELECT MIN(submitter_id) FROM submissions WHERE submitter_id>submitter_ids.id)
+                    FROM submitter_ids WHERE id IS NOT NULL
+                )
+                SELECT id FROM submitter_ids WHERE id IS NOT NULL
+            '''
+        )
 
     def is_variant_name(self, variant_name):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE variant_name=? LIMIT 1',
+        #there are too many variant names to keep in memory, so each release is asked in turn, but the catalog of a
+        #partitioned database lists every name of every release so that a name that is in none of them is turned away
+        #without opening each release's file
+        if self.db.partitioned and not list(
+            self.cursor.execute('SELECT 1 FROM all_variant_names WHERE value=?', [variant_name])
+        ):
+            return False
+        return any(self.history(
+            '''
+                SELECT 1 FROM variant_names
+                WHERE value=? AND EXISTS (SELECT 1 FROM submissions WHERE variant_name_id=variant_names.id) LIMIT 1
+            ''',
             [variant_name]
-        )))
+        ))
 
     def max_date(self):
-        return list(self.cursor.execute('SELECT MAX(date) FROM submissions'))[0][0]
+        dates = self.dates()
+        return dates[0] if dates else None
 
     @promise
+    @cached
     def significance_term_info(self):
-        return list(self.cursor.execute('''
-            SELECT significance, MIN(date) AS first_seen, MAX(date) AS last_seen FROM submissions
-            GROUP BY significance ORDER BY last_seen DESC, first_seen DESC
-        '''))
+        terms = {}
+        for row in self.history('''
+            SELECT value AS significance, MIN(valid_from) AS first_seen, MAX(valid_to) AS last_seen
+            FROM submission_versions INNER JOIN significances ON significances.id=significance_id
+            GROUP BY significance_id
+        '''):
+            first_seen, last_seen = terms.get(row['significance'], (row['first_seen'], row['last_seen']))
+            terms[row['significance']] = (min(first_seen, row['first_seen']), max(last_seen, row['last_seen']))
+
+        rows = list(map(
+            lambda term: {'significance': term[0], 'first_seen': term[1][0], 'last_seen': term[1][1]},
+            sorted(terms.items())
+        ))
+        rows.sort(key=lambda row: (row['last_seen'], row['first_seen']), reverse=True)
+        return rows
 
     def submissions(self, **kwargs):
         self.query = '''
@@ -193,7 +486,7 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('variant_name'):
@@ -205,15 +498,18 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY scv1 ORDER BY star_level1 DESC'
+        self.query += ' GROUP BY scv1 ORDER BY star_level1 DESC, scv1'
 
         return self.rows()
 
     def submitter_id_from_name(self, submitter_name, date = None):
         try:
             return list(self.cursor.execute(
-                'SELECT submitter_id FROM submissions WHERE submitter_name=? AND date=? LIMIT 1',
-                [submitter_name, date or self.max_date()]
+                '''
+                    SELECT submitter_id FROM submissions
+                    WHERE submitter_name_id=(SELECT id FROM submitter_names WHERE value=?) AND date=? LIMIT 1
+                ''',
+                [submitter_name, self.use_release(date)]
             ))[0][0]
         except IndexError:
             return None
@@ -225,7 +521,7 @@ class DB():
                     SELECT submitter_name, submitter_country_name
                     FROM submissions WHERE submitter_id=? AND date=? LIMIT 1
                 ''',
-                [submitter_id, date or self.max_date()]
+                [submitter_id, self.use_release(date)]
             ))[0]
             return {'id': submitter_id, 'name': row[0], 'country_name': row[1]}
         except IndexError:
@@ -236,16 +532,17 @@ class DB():
             return list(
                 self.cursor.execute('''
                     SELECT method FROM submissions WHERE submitter_id=? AND date=?
-                    GROUP BY method ORDER BY COUNT(*) DESC LIMIT 1
-                ''', [submitter_id, date or self.max_date()])
+                    GROUP BY method ORDER BY COUNT(*) DESC, method LIMIT 1
+                ''', [submitter_id, self.use_release(date)])
             )[0][0]
         except IndexError:
             return 'not provided'
 
     @promise
+    @cached
     def total_conditions(self, **kwargs):
         self.query = '''
-            SELECT COUNT(DISTINCT condition1_name) FROM comparisons
+            SELECT COUNT(DISTINCT condition1_name_id) FROM comparisons
             WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
         '''
 
@@ -253,7 +550,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene'):
@@ -282,11 +579,12 @@ class DB():
         return self.value()
 
     @promise
+    @cached
     def total_genes(self, **kwargs):
         if kwargs.get('original_genes'):
-            self.query = 'SELECT COUNT(DISTINCT gene) FROM comparisons'
+            self.query = 'SELECT COUNT(DISTINCT gene_id) FROM comparisons'
         else:
-            self.query = 'SELECT COUNT(DISTINCT normalized_gene) FROM comparisons'
+            self.query = 'SELECT COUNT(DISTINCT normalized_gene_id) FROM comparisons'
 
         self.query += ' WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date'
 
@@ -294,12 +592,15 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -322,25 +623,27 @@ class DB():
     def mondo_conditions(self, date = None):
         return list(self.cursor.execute(
             'SELECT DISTINCT mondo_id, mondo_name FROM mondo_clinvar_relationships WHERE date=? ORDER BY mondo_name',
-            [date or self.max_date()]
+            [self.use_release(date)]
         ))
 
     def mondo_name(self, mondo_id, date = None):
         try:
             return list(self.cursor.execute(
                 'SELECT mondo_name FROM mondo_clinvar_relationships where mondo_id=? AND date=? LIMIT 1',
-                [mondo_id, date or self.max_date()]
+                [mondo_id, self.use_release(date)]
             ))[0][0]
         except IndexError:
             return 'MONDO:' + str(mondo_id).zfill(7)
 
     @promise
+    @cached
     def total_significance_terms_over_time(self):
         return list(
-            self.cursor.execute('SELECT date, COUNT(DISTINCT significance) AS count FROM submissions GROUP BY date')
+            self.history('SELECT date, COUNT(DISTINCT significance_id) AS count FROM submissions GROUP BY date')
         )
 
     @promise
+    @cached
     def total_submissions(self, **kwargs):
         self.query = '''
             SELECT COUNT(DISTINCT scv1) FROM comparisons
@@ -350,7 +653,7 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('country_code'):
@@ -364,6 +667,7 @@ class DB():
         return self.value()
 
     @promise
+    @cached
     def total_submitters(self, **kwargs):
         self.query = '''
             SELECT COUNT(DISTINCT submitter1_id) FROM comparisons
@@ -374,7 +678,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene'):
@@ -386,6 +690,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('normalized_method1'):
             self.and_equals('normalized_method1', kwargs['normalized_method1'])
 
@@ -403,6 +710,7 @@ class DB():
         return self.value()
 
     @promise
+    @cached
     def total_submissions_by_country(self, **kwargs):
         self.query = '''
             SELECT
@@ -415,7 +723,7 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('normalized_method'):
@@ -424,11 +732,12 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY country_code ORDER BY count DESC'
+        self.query += ' GROUP BY country_code ORDER BY count DESC, country_code'
 
         return self.rows()
 
     @promise
+    @cached
     def total_submissions_by_method(self, **kwargs):
         self.query = '''
             SELECT method1 AS method, COUNT(DISTINCT scv1) AS count
@@ -438,16 +747,17 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY method ORDER BY count DESC'
+        self.query += ' GROUP BY method1_id ORDER BY count DESC, method'
 
         return self.rows()
 
     @promise
+    @cached
     def total_submissions_by_normalized_method_over_time(self, **kwargs):
         self.query = '''
             SELECT date, normalized_method1 AS normalized_method, COUNT(DISTINCT scv1) AS count
@@ -457,16 +767,17 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY date, normalized_method ORDER BY date, count DESC'
+        self.query += ' GROUP BY date, normalized_method1_id ORDER BY date, count DESC, normalized_method'
 
-        return self.rows();
+        return list(self.history(self.query, self.parameters))
 
     @promise
+    @cached
     def total_submissions_by_submitter(self, **kwargs):
         self.query = '''
             SELECT submitter1_id AS submitter_id, submitter1_name AS submitter_name, COUNT(DISTINCT scv1) AS count
@@ -477,7 +788,7 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('country_code'):
@@ -488,14 +799,15 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY submitter1_id ORDER BY count DESC'
+        self.query += ' GROUP BY submitter1_id ORDER BY count DESC, submitter1_id'
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants(self, **kwargs):
         self.query = '''
-            SELECT COUNT(DISTINCT variant_name) FROM comparisons
+            SELECT COUNT(DISTINCT variant_name_id) FROM comparisons
             WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
         '''
 
@@ -503,7 +815,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -515,6 +827,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -544,20 +859,23 @@ class DB():
         return self.value()
 
     @promise
+    @cached
     def total_variants_by_condition(self, **kwargs):
         if type(kwargs.get('condition1_name')) is not str:
             self.query = 'SELECT condition1_name AS condition_name'
+            group_column = 'condition1_name_id'
         else:
             self.query = 'SELECT condition2_name AS condition_name'
+            group_column = 'condition2_name_id'
 
         if kwargs.get('original_genes'):
-            self.query += ', COUNT(DISTINCT gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT gene_id) AS gene_count'
         else:
-            self.query += ', COUNT(DISTINCT normalized_gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT normalized_gene_id) AS gene_count'
 
         self.query += '''
             , COUNT(DISTINCT submitter1_id) AS submitter_count
-            , COUNT(DISTINCT variant_name) AS count
+            , COUNT(DISTINCT variant_name_id) AS count
             FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
         '''
 
@@ -565,7 +883,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -577,6 +895,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -600,18 +921,21 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY condition_name ORDER BY count DESC'
+        self.query += ' GROUP BY ' + group_column + ' ORDER BY count DESC, condition_name'
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants_by_condition_and_significance(self, **kwargs):
-        self.query = 'SELECT condition1_name AS condition_name, COUNT(DISTINCT variant_name) AS count'
+        self.query = 'SELECT condition1_name AS condition_name, COUNT(DISTINCT variant_name_id) AS count'
 
         if kwargs.get('original_terms'):
             self.query += ', significance1 AS significance'
+            significance_column = 'significance1_id'
         else:
             self.query += ', normalized_significance1 AS significance'
+            significance_column = 'normalized_significance1_id'
 
         self.query += ' FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date'
 
@@ -619,7 +943,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -631,6 +955,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -648,11 +975,114 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY condition_name, significance'
+        self.query += (
+            ' GROUP BY condition1_name_id, ' + significance_column + ' ORDER BY condition_name, significance'
+        )
+
+        return self.rows()
+
+    @promise
+    @cached
+    def total_variants_by_conflict_level(self, group_by = None, **kwargs):
+        #the totals, the potential conflicts, the conflicts and each level of conflict are all counted in a single pass
+        #over the comparisons, optionally for each condition, gene or submitter
+        if group_by == 'condition':
+            if type(kwargs.get('condition1_name')) is not str:
+                columns = 'condition1_name AS condition_name, '
+                group_column = 'condition1_name'
+            else:
+                columns = 'condition2_name AS condition_name, '
+                group_column = 'condition2_name'
+        elif group_by == 'gene':
+            if kwargs.get('original_genes'):
+                columns = 'gene, '
+                group_column = 'gene'
+            else:
+                columns = 'normalized_gene AS gene, '
+                group_column = 'normalized_gene'
+        elif group_by == 'submitter':
+            if type(kwargs.get('submitter1_id')) is not int:
+                columns = 'submitter1_id AS submitter_id, submitter1_name AS submitter_name, '
+                group_column = 'submitter1_id'
+            else:
+                columns = 'submitter2_id AS submitter_id, submitter2_name AS submitter_name, '
+                group_column = 'submitter2_id'
+        else:
+            columns = ''
+            group_column = None
+
+        self.query = ' FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date'
+
+        self.parameters = {
+            'min_stars1': kwargs.get('min_stars1', 0),
+            'min_stars2': kwargs.get('min_stars2', 0),
+            'min_conflict_level': kwargs.get('min_conflict_level', 1),
+            'date': self.use_release(kwargs.get('date')),
+        }
+
+        if kwargs.get('gene') != None:
+            if kwargs.get('original_genes'):
+                self.and_equals('gene', kwargs['gene'])
+            else:
+                self.and_equals('normalized_gene', kwargs['gene'])
+
+        if kwargs.get('condition1_name') != None:
+            self.and_equals('condition1_name', kwargs['condition1_name'])
+
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
+        if kwargs.get('submitter1_id'):
+            self.and_equals('submitter1_id', kwargs['submitter1_id'])
+
+        if kwargs.get('submitter2_id'):
+            self.and_equals('submitter2_id', kwargs['submitter2_id'])
+
+        if kwargs.get('significance1'):
+            if kwargs.get('original_terms'):
+                self.and_equals('significance1', kwargs['significance1'])
+            else:
+                self.and_equals('normalized_significance1', kwargs['significance1'])
+
+        if kwargs.get('normalized_method1'):
+            self.and_equals('normalized_method1', kwargs['normalized_method1'])
+
+        if kwargs.get('normalized_method2'):
+            self.and_equals('normalized_method2', kwargs['normalized_method2'])
+
+        if kwargs.get('gene_type', -1) != -1:
+            if kwargs.get('original_genes'):
+                self.and_equals('gene_type', kwargs['gene_type'])
+            else:
+                self.and_equals('normalized_gene_type', kwargs['gene_type'])
+
+        #a variant counts towards the total the same way that it does in total_variants
+        if self.comparison_required(-1):
+            total_condition = 'TRUE'
+        else:
+            total_condition = 'conflict_level=-1'
+        counts = [
+            'COUNT(DISTINCT CASE WHEN ' + total_condition + ' THEN variant_name_id END) AS count',
+            'COUNT(DISTINCT CASE WHEN conflict_level>=0 THEN variant_name_id END) AS potentially_in_conflict_count',
+            'COUNT(DISTINCT CASE WHEN conflict_level>=:min_conflict_level THEN variant_name_id END) AS in_conflict_count',
+        ]
+        for conflict_level in range(0, 6):
+            counts.append(
+                'COUNT(DISTINCT CASE WHEN conflict_level=' + str(conflict_level) + ' THEN variant_name_id END) AS ' +
+                'conflict_level' + str(conflict_level) + '_count'
+            )
+
+        self.query = 'SELECT ' + columns + ', '.join(counts) + self.query
+
+        if group_column:
+            self.query += (
+                ' GROUP BY ' + self.key_column(group_column) + ' ORDER BY in_conflict_count DESC, ' + group_column
+            )
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants_by_gene(self, **kwargs):
         if kwargs.get('original_genes'):
             self.query = 'SELECT gene'
@@ -660,9 +1090,9 @@ class DB():
             self.query = 'SELECT normalized_gene AS gene'
 
         self.query += '''
-            , COUNT(DISTINCT condition1_name) AS condition_count
+            , COUNT(DISTINCT condition1_name_id) AS condition_count
             , COUNT(DISTINCT submitter1_id) AS submitter_count
-            , COUNT(DISTINCT variant_name) AS count
+            , COUNT(DISTINCT variant_name_id) AS count
             FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
         '''
 
@@ -670,12 +1100,15 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -706,25 +1139,28 @@ class DB():
         self.and_optimized_conflict_level()
 
         if kwargs.get('original_genes'):
-            self.query += ' GROUP BY gene ORDER BY count DESC'
+            self.query += ' GROUP BY gene_id ORDER BY count DESC, gene'
         else:
-            self.query += ' GROUP BY normalized_gene ORDER BY count DESC'
+            self.query += ' GROUP BY normalized_gene_id ORDER BY count DESC, gene'
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants_by_gene_and_significance(self, **kwargs):
         if kwargs.get('original_genes'):
             self.query = 'SELECT gene'
         else:
             self.query = 'SELECT normalized_gene AS gene'
 
-        self.query += ', COUNT(DISTINCT variant_name) AS count'
+        self.query += ', COUNT(DISTINCT variant_name_id) AS count'
 
         if kwargs.get('original_terms'):
             self.query += ', significance1 AS significance'
+            significance_column = 'significance1_id'
         else:
             self.query += ', normalized_significance1 AS significance'
+            significance_column = 'normalized_significance1_id'
 
         self.query += ' FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date'
 
@@ -732,12 +1168,15 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -756,28 +1195,31 @@ class DB():
         self.and_optimized_conflict_level()
 
         if kwargs.get('original_genes'):
-            self.query += ' GROUP BY gene, significance'
+            self.query += ' GROUP BY gene_id, ' + significance_column + ' ORDER BY gene, significance'
         else:
-            self.query += ' GROUP BY normalized_gene, significance'
+            self.query += ' GROUP BY normalized_gene_id, ' + significance_column + ' ORDER BY gene, significance'
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants_by_significance(self, **kwargs):
-        self.query = 'SELECT COUNT(DISTINCT variant_name) AS count'
+        self.query = 'SELECT COUNT(DISTINCT variant_name_id) AS count'
 
         if kwargs.get('original_terms'):
             self.query += ', significance1 AS significance'
+            significance_column = 'significance1_id'
         else:
             self.query += ', normalized_significance1 AS significance'
+            significance_column = 'normalized_significance1_id'
 
         if kwargs.get('original_genes'):
-            self.query += ', COUNT(DISTINCT gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT gene_id) AS gene_count'
         else:
-            self.query += ', COUNT(DISTINCT normalized_gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT normalized_gene_id) AS gene_count'
 
         self.query += '''
-            , COUNT(DISTINCT condition1_name) AS condition_count
+            , COUNT(DISTINCT condition1_name_id) AS condition_count
             , COUNT(DISTINCT submitter1_id) AS submitter_count
             FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
         '''
@@ -786,7 +1228,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -798,6 +1240,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -815,11 +1260,12 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY significance ORDER BY count DESC'
+        self.query += ' GROUP BY ' + significance_column + ' ORDER BY count DESC, significance'
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants_by_submitter(self, **kwargs):
         if type(kwargs.get('submitter1_id')) is not int:
             self.query = 'SELECT submitter1_id AS submitter_id, submitter1_name AS submitter_name'
@@ -827,13 +1273,13 @@ class DB():
             self.query = 'SELECT submitter2_id AS submitter_id, submitter2_name AS submitter_name'
 
         if kwargs.get('original_genes'):
-            self.query += ', COUNT(DISTINCT gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT gene_id) AS gene_count'
         else:
-            self.query += ', COUNT(DISTINCT normalized_gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT normalized_gene_id) AS gene_count'
 
         self.query += '''
-            , COUNT(DISTINCT condition1_name) AS condition_count
-            , COUNT(DISTINCT variant_name) AS count
+            , COUNT(DISTINCT condition1_name_id) AS condition_count
+            , COUNT(DISTINCT variant_name_id) AS count
             FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
         '''
 
@@ -841,7 +1287,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -853,6 +1299,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -879,18 +1328,21 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY submitter_id ORDER BY count DESC'
+        self.query += ' GROUP BY submitter_id ORDER BY count DESC, submitter_id'
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants_by_submitter_and_significance(self, **kwargs):
-        self.query = 'SELECT submitter1_id AS submitter_id, COUNT(DISTINCT variant_name) AS count'
+        self.query = 'SELECT submitter1_id AS submitter_id, COUNT(DISTINCT variant_name_id) AS count'
 
         if kwargs.get('original_terms'):
             self.query += ', significance1 AS significance'
+            significance_column = 'significance1_id'
         else:
             self.query += ', normalized_significance1 AS significance'
+            significance_column = 'normalized_significance1_id'
 
         self.query += ' FROM comparisons WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date'
 
@@ -898,86 +1350,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
-        }
-
-        if kwargs.get('gene') != None:
-            if kwargs.get('original_genes'):
-                self.and_equals('gene', kwargs['gene'])
-            else:
-                self.and_equals('normalized_gene', kwargs['gene'])
-
-        if kwargs.get('condition1_name') != None:
-            self.and_equals('condition1_name', kwargs['condition1_name'])
-
-        if kwargs.get('normalized_method1'):
-            self.and_equals('normalized_method1', kwargs['normalized_method1'])
-
-        if kwargs.get('normalized_method2'):
-            self.and_equals('normalized_method2', kwargs['normalized_method2'])
-
-        if kwargs.get('gene_type', -1) != -1:
-            if kwargs.get('original_genes'):
-                self.and_equals('gene_type', kwargs['gene_type'])
-            else:
-                self.and_equals('normalized_gene_type', kwargs['gene_type'])
-
-        self.and_optimized_conflict_level()
-
-        self.query += ' GROUP BY submitter_id, significance'
-
-        return self.rows()
-
-
-    @promise
-    def total_variants_in_conflict_by_condition_and_conflict_level(self, **kwargs):
-        if type(kwargs.get('condition1_name')) is not str:
-            self.query = 'SELECT condition1_name AS condition_name'
-        else:
-            self.query = 'SELECT condition2_name AS condition_name'
-
-        self.query += '''
-            , conflict_level, COUNT(DISTINCT variant_name) AS count
-            FROM comparisons
-            WHERE
-                star_level1>=:min_stars1 AND
-                star_level2>=:min_stars2 AND
-                conflict_level>=:min_conflict_level AND
-                date=:date
-        '''
-
-        self.parameters = {
-            'min_stars1': kwargs.get('min_stars1', 0),
-            'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
-        }
-
-        if kwargs.get('condition1_name') != None:
-            self.and_equals('condition1_name', kwargs['condition1_name'])
-
-        if kwargs.get('normalized_method1'):
-            self.and_equals('normalized_method1', kwargs['normalized_method1'])
-
-        if kwargs.get('normalized_method2'):
-            self.and_equals('normalized_method2', kwargs['normalized_method2'])
-
-        self.query += ' GROUP BY condition_name, conflict_level'
-
-        return self.rows()
-
-    @promise
-    def total_variants_in_conflict_by_conflict_level(self, **kwargs):
-        self.query = '''
-            SELECT conflict_level, COUNT(DISTINCT variant_name) AS count FROM comparisons
-            WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
-        '''
-
-        self.parameters = {
-            'min_stars1': kwargs.get('min_stars1', 0),
-            'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -989,11 +1362,8 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
-        if kwargs.get('submitter1_id'):
-            self.and_equals('submitter1_id', kwargs['submitter1_id'])
-
-        if kwargs.get('submitter2_id'):
-            self.and_equals('submitter2_id', kwargs['submitter2_id'])
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
 
         if kwargs.get('normalized_method1'):
             self.and_equals('normalized_method1', kwargs['normalized_method1'])
@@ -1009,60 +1379,13 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY conflict_level'
+        self.query += ' GROUP BY submitter_id, ' + significance_column + ' ORDER BY submitter_id, significance'
 
         return self.rows()
 
-    @promise
-    def total_variants_in_conflict_by_gene_and_conflict_level(self, **kwargs):
-        if kwargs.get('original_genes'):
-            self.query = 'SELECT gene'
-        else:
-            self.query = 'SELECT normalized_gene AS gene'
-
-        self.query += '''
-            , conflict_level, COUNT(DISTINCT variant_name) AS count
-            FROM comparisons
-            WHERE
-                star_level1>=:min_stars1 AND
-                star_level2>=:min_stars2 AND
-                conflict_level>=:min_conflict_level AND
-                date=:date
-        '''
-
-        self.parameters = {
-            'min_stars1': kwargs.get('min_stars1', 0),
-            'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
-        }
-
-        if kwargs.get('normalized_method1'):
-            self.and_equals('normalized_method1', kwargs['normalized_method1'])
-
-        if kwargs.get('normalized_method2'):
-            self.and_equals('normalized_method2', kwargs['normalized_method2'])
-
-        if kwargs.get('gene_type', -1) != -1:
-            if kwargs.get('original_genes'):
-                self.and_equals('gene_type', kwargs['gene_type'])
-            else:
-                self.and_equals('normalized_gene_type', kwargs['gene_type'])
-
-        if kwargs.get('gene'):
-            if kwargs.get('original_genes'):
-                self.and_equals('gene', kwargs['gene'])
-            else:
-                self.and_equals('normalized_gene', kwargs['gene'])
-
-        if kwargs.get('original_genes'):
-            self.query += ' GROUP BY gene, conflict_level'
-        else:
-            self.query += ' GROUP BY normalized_gene, conflict_level'
-
-        return self.rows()
 
     @promise
+    @cached
     def total_variants_in_conflict_by_significance_and_significance(self, **kwargs):
         if kwargs.get('original_terms'):
             self.query = 'SELECT significance1, significance2'
@@ -1072,7 +1395,7 @@ class DB():
             '''
 
         self.query += '''
-            , conflict_level, COUNT(DISTINCT variant_name) AS count
+            , conflict_level, COUNT(DISTINCT variant_name_id) AS count
             FROM comparisons WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -1084,7 +1407,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -1096,6 +1419,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -1115,53 +1441,18 @@ class DB():
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
         if kwargs.get('original_terms'):
-            self.query += ' GROUP BY significance1, significance2'
-        else:
-            self.query += ' GROUP BY normalized_significance1, normalized_significance2'
-
-        return self.rows()
-
-    @promise
-    def total_variants_in_conflict_by_submitter_and_conflict_level(self, **kwargs):
-        if type(kwargs.get('submitter1_id')) is not int:
-            self.query = 'SELECT submitter1_id AS submitter_id'
+            self.query += ' GROUP BY significance1_id, significance2_id'
         else:
-            self.query = 'SELECT submitter2_id AS submitter_id'
-
-        self.query += '''
-            , conflict_level, COUNT(DISTINCT variant_name) AS count
-            FROM comparisons
-            WHERE
-                star_level1>=:min_stars1 AND
-                star_level2>=:min_stars2 AND
-                conflict_level>=:min_conflict_level AND
-                date=:date
-        '''
-
-        self.parameters = {
-            'min_stars1': kwargs.get('min_stars1', 0),
-            'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
-        }
-
-        if kwargs.get('submitter1_id'):
-            self.and_equals('submitter1_id', kwargs['submitter1_id'])
-
-        if kwargs.get('normalized_method1'):
-            self.and_equals('normalized_method1', kwargs['normalized_method1'])
-
-        if kwargs.get('normalized_method2'):
-            self.and_equals('normalized_method2', kwargs['normalized_method2'])
-
-        self.query += ' GROUP BY submitter_id, conflict_level'
+            self.query += ' GROUP BY normalized_significance1_id, normalized_significance2_id'
+        self.query += ' ORDER BY significance1, significance2'
 
         return self.rows()
 
     @promise
+    @cached
     def total_variants_without_significance(self, **kwargs):
         self.query = '''
-            SELECT COUNT(DISTINCT variant_name) FROM comparisons
+            SELECT COUNT(DISTINCT variant_name_id) FROM comparisons
             WHERE star_level1>=:min_stars1 AND star_level2>=:min_stars2 AND date=:date
         '''
 
@@ -1169,7 +1460,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
             'significance': kwargs['significance'],
         }
 
@@ -1197,8 +1488,11 @@ class DB():
     def variant_info(self, variant_name, date = None):
         try:
             row = list(self.cursor.execute(
-                'SELECT variant_id, rsid FROM submissions WHERE variant_name=? AND date=? LIMIT 1',
-                [variant_name, date or self.max_date()]
+                '''
+                    SELECT variant_id, rsid FROM submissions
+                    WHERE variant_name_id=(SELECT id FROM variant_names WHERE value=?) AND date=? LIMIT 1
+                ''',
+                [variant_name, self.use_release(date)]
             ))[0]
             return {'id': row[0], 'name': variant_name, 'rsid': row[1]}
         except IndexError:
@@ -1208,7 +1502,7 @@ class DB():
         try:
             return list(self.cursor.execute(
                 'SELECT variant_name FROM submissions WHERE rcv=? AND date=? LIMIT 1',
-                [rcv, date or self.max_date()]
+                [rcv, self.use_release(date)]
             ))[0][0]
         except IndexError:
             return None
@@ -1216,7 +1510,7 @@ class DB():
     def variant_name_from_rsid(self, rsid, date = None):
         rows = list(self.cursor.execute(
             'SELECT DISTINCT variant_name FROM submissions WHERE rsid=? AND date=?',
-            [rsid, date or self.max_date()]
+            [rsid, self.use_release(date)]
         ))
         return rows[0][0] if len(rows) == 1 else None
 
@@ -1224,12 +1518,13 @@ class DB():
         try:
             return list(self.cursor.execute(
                 'SELECT variant_name FROM submissions WHERE scv=? AND date=? LIMIT 1',
-                [scv, date or self.max_date()]
+                [scv, self.use_release(date)]
             ))[0][0]
         except IndexError:
             return None
 
     @promise
+    @cached
     def variants(self, **kwargs):
         self.query = '''
             SELECT variant_name, rsid FROM comparisons
@@ -1240,7 +1535,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.use_release(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -1252,6 +1547,9 @@ class DB():
         if kwargs.get('condition1_name') != None:
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('mondo_id') != None:
+            self.and_mondo_condition(kwargs['mondo_id'])
+
         if kwargs.get('submitter1_id'):
             self.and_equals('submitter1_id', kwargs['submitter1_id'])
 
@@ -1284,6 +1582,6 @@ class DB():
 
         self.and_optimized_conflict_level()
 
-        self.query += ' GROUP BY variant_name ORDER BY variant_name'
+        self.query += ' GROUP BY variant_name_id ORDER BY variant_name'
 
         return self.rows()
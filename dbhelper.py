@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+from fcntl import LOCK_EX, flock
+from os import environ
+import sqlite3
+
+#the database to build, which is clinvar.db unless a new version is being staged before it is published
+clinvar_db = environ.get('CLINVAR_DB', 'clinvar.db')
+
+#text columns that are stored as integer keys into a table of their distinct values
+dimension_tables = {
+    'variant_name': 'variant_names',
+    'gene': 'genes',
+    'normalized_gene': 'genes',
+    'submitter_name': 'submitter_names',
+    'significance': 'significances',
+    'normalized_significance': 'significances',
+    'condition_name': 'condition_names',
+    'method': 'methods',
+    'normalized_method': 'methods',
+}
+
+def connect(filename = clinvar_db):
+    return sqlite3.connect(filename, timeout=600)
+
+@contextmanager
+def write_lock(filename = clinvar_db):
+    #serialize the writes of imports that run at the same time
+    with open(filename + '.lock', 'w') as lock_file:
+        flock(lock_file, LOCK_EX)
+        yield
+
+def is_temporal(cursor):
+    #in the temporal layout, each version of a submission is stored once instead of once per release
+    return bool(list(cursor.execute('SELECT 1 FROM sqlite_master WHERE name=? AND type=?', ['submission_versions', 'table'])))
+
+def is_partitioned(cursor):
+    #in the partitioned layout, the database only lists the releases and each release is stored in a file of its own
+    return bool(list(cursor.execute('SELECT 1 FROM sqlite_master WHERE name=? AND type=?', ['partitions', 'table'])))
+
+def get_partition_filename(date):
+    return 'clinvar-' + date + '.db'
+
+def create_import_state_table(cursor):
+    #how far the import of each release got, so that an interrupted build can pick up where it stopped
+    cursor.execute('CREATE TABLE IF NOT EXISTS import_state (date TEXT PRIMARY KEY, filename TEXT, stage TEXT)')
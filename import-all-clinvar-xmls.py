@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from glob import glob
+from os import remove
+from os.path import basename, exists, join
+from shutil import copyfileobj
+from subprocess import run
+from time import monotonic
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from memoryhelper import get_available_memory
+import dbhelper
+
+def release_urls():
+    today = date.today()
+    for year in range(2012, today.year):
+        for month in range(1, 13):
+            yield f'https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/archive/{year}/ClinVarFullRelease_{year}-{month:02}.xml.gz'
+    for month in range(1, today.month + 1):
+        yield f'https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/ClinVarFullRelease_{today.year}-{month:02}.xml.gz'
+
+def mirrored_releases(mirror):
+    return sorted(glob(join(mirror, '**', 'ClinVarFullRelease_*.xml.gz'), recursive=True), key=basename)
+
+def imported_releases():
+    #the files of the releases that a previous run got through
+    if not exists(dbhelper.clinvar_db):
+        return set()
+    db = dbhelper.connect()
+    filenames = set()
+    if list(db.execute('SELECT 1 FROM sqlite_master WHERE name=?', ['import_state'])):
+        filenames = set(row[0] for row in db.execute(
+            'SELECT filename FROM import_state WHERE stage IN (?,?) AND date IN (SELECT date FROM releases)', ['imported', 'indexed']
+        ))
+    db.close()
+    return filenames
+
+def download(url):
+    filename = basename(url)
+    print('Downloading ' + url)
+    try:
+        with urlopen(url) as response, open(filename, 'wb') as f:
+            copyfileobj(response, f)
+    except HTTPError: #not every month has a release
+        return None
+    return filename
+
+def fetch(source, mirrored):
+    start = monotonic()
+    filename = source if mirrored else download(source)
+    return filename, monotonic() - start
+
+def import_release(filename, mirrored, options):
+    start = monotonic()
+    try:
+        run(['./import-clinvar-xml.py'] + options + [filename], check=True)
+    finally:
+        if not mirrored:
+            remove(filename)
+    return filename, monotonic() - start
+
+def report(fetch_times, import_future):
+    filename, import_time = import_future.result()
+    print(f'{basename(filename)}: fetched in {fetch_times[filename]:.0f}s, imported in {import_time:.0f}s')
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Build the ClinVar Miner database from every monthly ClinVar release.')
+    parser.add_argument('--mirror', help='directory of ClinVarFullRelease_<year>-<month>.xml.gz files to use instead of downloading')
+    parser.add_argument('--jobs', type=int, default=2, help='number of releases to import at the same time')
+    parser.add_argument('--prefetch', type=int, default=1, help='number of releases to fetch ahead of the imports')
+    parser.add_argument(
+        '--temporal', action='store_true',
+        help='store each version of a submission once instead of once per release (imports one release at a time)'
+    )
+    parser.add_argument(
+        '--partitioned', action='store_true',
+        help='store each release in a file of its own so that reading one release only touches that file'
+    )
+    parser.add_argument('--workers', type=int, help='number of processes that each import uses (default: one per core)')
+    parser.add_argument(
+        '--memory-budget', type=int, metavar='MIB',
+        help='memory that the workers and the batches in flight of all imports together may take up'
+        ' (default: half of the memory that is available)'
+    )
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='skip the releases that a previous run imported and pick up the releases that it was importing'
+    )
+    args = parser.parse_args()
+
+    import_options = []
+    if args.temporal:
+        import_options.append('--temporal')
+        args.jobs = 1 #the releases have to be merged in chronological order
+    if args.partitioned:
+        import_options.append('--partitioned')
+    if args.workers:
+        import_options += ['--workers', str(args.workers)]
+    #the imports that run at the same time share the budget instead of each taking half of what is available
+    memory_budget = args.memory_budget or get_available_memory() // 2 // (1024 * 1024)
+    import_options += ['--memory-budget', str(max(memory_budget // args.jobs, 1))]
+    if args.resume:
+        import_options.append('--resume')
+
+    mirrored = bool(args.mirror)
+    sources = mirrored_releases(args.mirror) if mirrored else release_urls()
+    if args.resume:
+        imported = imported_releases()
+        sources = (source for source in sources if basename(source) not in imported)
+    sources = iter(sources)
+    fetch_times = {}
+    start = monotonic()
+
+    #fetch the next release while the current ones are being imported, and import several releases at once
+    #(import-clinvar-xml.py takes a lock for each write so that the imports do not contend for the database)
+    with ThreadPoolExecutor(1) as fetcher, ThreadPoolExecutor(args.jobs) as importer:
+        fetches = deque()
+        imports = deque()
+
+        def fetch_next():
+            source = next(sources, None)
+            if source:
+                fetches.append(fetcher.submit(fetch, source, mirrored))
+            return source
+
+        fetch_next()
+        while fetches:
+            if len(imports) >= args.jobs:
+                report(fetch_times, imports.popleft())
+
+            filename, fetch_time = fetches.popleft().result()
+            while len(fetches) < args.prefetch and fetch_next():
+                pass
+
+            if filename:
+                fetch_times[filename] = fetch_time
+                imports.append(importer.submit(import_release, filename, mirrored, import_options))
+
+        while imports:
+            report(fetch_times, imports.popleft())
+
+    print(f'Imported {len(fetch_times)} releases in {monotonic() - start:.0f}s')
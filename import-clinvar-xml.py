@@ -1,30 +1,49 @@
 #!/usr/bin/env python3
 
+from argparse import ArgumentParser
+from collections import deque
+from contextlib import contextmanager
 from copy import copy
-from functools import partial
-from mmap import mmap
+from dbhelper import (
+    clinvar_db, connect, create_import_state_table, dimension_tables, get_partition_filename, is_partitioned, is_temporal,
+    write_lock
+)
+from functools import lru_cache, partial
+from hashlib import blake2b
+from itertools import groupby, islice
 from mondo import Mondo
-from multiprocessing import Pool
-from os.path import getsize
-from psutil import virtual_memory
+from multiprocessing import Pool, cpu_count
+from memoryhelper import get_available_memory, get_private_memory
+from os import replace
+from os.path import basename, exists
 from pycountry import countries
-from sys import argv
+from shutil import copyfile, which
+from subprocess import CalledProcessError, PIPE, Popen
+from sys import getsizeof
+from threading import Condition
 from xml.etree import ElementTree
 import csv
+import gzip
 import re
-import sqlite3
 
-nonstandard_significance_term_map = dict(map(
-    lambda line: line[0:-1].split('\t'),
-    open('nonstandard_significance_terms.tsv')
-))
+#the lookup tables are only loaded by the imports that use them
+@lru_cache(maxsize=None)
+def get_nonstandard_significance_term_map():
+    return dict(map(
+        lambda line: line[0:-1].split('\t'),
+        open('nonstandard_significance_terms.tsv')
+    ))
 
-submitter_country_codes = dict(map(
-    lambda row: (int(row[0]), row[2]),
-    csv.reader(open('submitter_info.tsv', 'r'), delimiter='\t')
-))
+@lru_cache(maxsize=None)
+def get_submitter_country_codes():
+    return dict(map(
+        lambda row: (int(row[0]), row[2]),
+        csv.reader(open('submitter_info.tsv', 'r'), delimiter='\t')
+    ))
 
-mondo = Mondo()
+@lru_cache(maxsize=None)
+def get_mondo():
+    return Mondo()
 
 standard_methods = [
     'clinical testing',
@@ -33,84 +52,279 @@ standard_methods = [
     'research',
 ]
 
-def connect():
-    return sqlite3.connect('clinvar.db', timeout=600)
+clinvarsets_per_batch = 1000
+variants_per_batch = 1000
+batches_in_flight_per_worker = 4
+submissions_per_transaction = 100000
+#the stages of an import after which the release is stored in full
+complete_import_stages = ['imported', 'indexed']
+mondo_matches_per_worker = 100000
 
-def create_tables():
-    db = connect()
-    cursor = db.cursor()
+submission_columns = [
+    ('variant_id', 'INTEGER'),
+    ('variant_name', 'TEXT'),
+    ('rsid', 'TEXT'),
+    ('gene', 'TEXT'),
+    ('gene_type', 'INTEGER'),
+    ('normalized_gene', 'TEXT'),
+    ('normalized_gene_type', 'INTEGER'),
+    ('submitter_id', 'INTEGER'),
+    ('submitter_name', 'TEXT'),
+    ('submitter_country_code', 'TEXT'),
+    ('submitter_country_name', 'TEXT'),
+    ('rcv', 'INTEGER'),
+    ('scv', 'INTEGER'),
+    ('significance', 'TEXT'),
+    ('normalized_significance', 'TEXT'),
+    ('last_eval', 'TEXT'),
+    ('review_status', 'TEXT'),
+    ('star_level', 'INTEGER'),
+    ('condition_name', 'TEXT'),
+    ('condition_xrefs', 'TEXT'),
+    ('method', 'TEXT'),
+    ('normalized_method', 'TEXT'),
+    ('comment', 'TEXT'),
+]
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS submissions (
-            date TEXT,
-            variant_id INTEGER,
-            variant_name TEXT,
-            rsid TEXT,
-            gene TEXT,
-            gene_type INTEGER,
-            normalized_gene TEXT,
-            normalized_gene_type INTEGER,
-            submitter_id INTEGER,
-            submitter_name TEXT,
-            submitter_country_code TEXT,
-            submitter_country_name TEXT,
-            rcv INTEGER,
-            scv INTEGER,
-            significance TEXT,
-            normalized_significance TEXT,
-            last_eval TEXT,
-            review_status TEXT,
-            star_level INTEGER,
-            condition_name TEXT,
-            condition_xrefs TEXT,
-            method TEXT,
-            normalized_method TEXT,
-            comment TEXT,
-            PRIMARY KEY (date, scv)
+submission_column_names = ','.join(name for name, db_type in submission_columns)
+submission_column_definitions = ','.join(name + ' ' + db_type for name, db_type in submission_columns)
+encoded_submission_column_names = ','.join(
+    name + '_id' if name in dimension_tables else name for name, db_type in submission_columns
+)
+encoded_submission_column_definitions = ','.join(
+    name + '_id INTEGER' if name in dimension_tables else name + ' ' + db_type for name, db_type in submission_columns
+)
+
+#the columns of both submissions of a pair that the pages filter, group and count by are copied into the pair as
+#keys, so that the queries can be answered from the indexes of the pairs without looking up the submissions (the
+#columns that are also copied from the second submission come first)
+comparison_columns = [
+    ('star_level', 'star_level1', 'star_level2'),
+    ('submitter_id', 'submitter1_id', 'submitter2_id'),
+    ('submitter_name_id', 'submitter1_name_id', 'submitter2_name_id'),
+    ('significance_id', 'significance1_id', 'significance2_id'),
+    ('normalized_significance_id', 'normalized_significance1_id', 'normalized_significance2_id'),
+    ('condition_name_id', 'condition1_name_id', 'condition2_name_id'),
+    ('normalized_method_id', 'normalized_method1_id', 'normalized_method2_id'),
+    ('method_id', 'method1_id', None),
+    ('submitter_country_code', 'submitter1_country_code', None),
+    ('variant_name_id', 'variant_name_id', None),
+    ('gene_id', 'gene_id', None),
+    ('gene_type', 'gene_type', None),
+    ('normalized_gene_id', 'normalized_gene_id', None),
+    ('normalized_gene_type', 'normalized_gene_type', None),
+]
+submission2_comparison_column_count = len([name2 for name, name1, name2 in comparison_columns if name2])
+comparison_column_names = ','.join(
+    [name1 for name, name1, name2 in comparison_columns] + [name2 for name, name1, name2 in comparison_columns if name2]
+)
+comparison_column_definitions = ','.join(
+    [name1 + ' ' + dict(submission_columns).get(name, 'INTEGER') for name, name1, name2 in comparison_columns] +
+    [name2 + ' ' + dict(submission_columns).get(name, 'INTEGER') for name, name1, name2 in comparison_columns if name2]
+)
+
+def get_comparison_values(table1, table2):
+    return ','.join(
+        [table1 + '.' + name for name, name1, name2 in comparison_columns] +
+        [table2 + '.' + name for name, name1, name2 in comparison_columns if name2]
+    )
+
+def get_encoded_values(table):
+    #look up the dimension keys of the text columns of a table of submissions
+    return ','.join(
+        '(SELECT id FROM ' + dimension_tables[name] + ' WHERE value=' + table + '.' + name + ') AS ' + name + '_id'
+        if name in dimension_tables else table + '.' + name
+        for name, db_type in submission_columns
+    )
+
+def get_decoded_columns(table):
+    #the text is only looked up for the columns that a query uses, filters should use the keys
+    columns = []
+    key_columns = []
+    for name, db_type in submission_columns:
+        if name in dimension_tables:
+            columns.append('(SELECT value FROM ' + dimension_tables[name] + ' WHERE id=' + table + '.' + name + '_id) AS ' + name)
+            key_columns.append(table + '.' + name + '_id')
+        else:
+            columns.append(table + '.' + name)
+    return ','.join(columns + key_columns)
+
+def intern_dimensions(cursor, table):
+    for name, dimension_table in dimension_tables.items():
+        cursor.execute('INSERT OR IGNORE INTO ' + dimension_table + ' (value) SELECT DISTINCT ' + name + ' FROM ' + table)
+
+def encode_table(cursor, table, key_column_definitions, primary_key):
+    #databases from before the text columns were stored in dimension tables
+    cursor.execute('DROP VIEW IF EXISTS comparisons')
+    intern_dimensions(cursor, table)
+    key_columns = ','.join(definition.split(' ')[0] for definition in key_column_definitions)
+    cursor.execute(
+        'CREATE TABLE encoded_table (' + ','.join(key_column_definitions) + ',' +
+        encoded_submission_column_definitions + ', PRIMARY KEY (' + primary_key + '))'
+    )
+    cursor.execute('INSERT INTO encoded_table SELECT ' + key_columns + ',' + get_encoded_values(table) + ' FROM ' + table)
+    cursor.execute('DROP TABLE ' + table)
+
+def create_catalog_tables(cursor, temporal):
+    if temporal:
+        raise ValueError(clinvar_db + ' stores each release in a file of its own')
+    if list(cursor.execute('SELECT 1 FROM sqlite_master WHERE name IN (?,?,?)', ['submissions', 'encoded_submissions', 'submission_versions'])):
+        raise ValueError(clinvar_db + ' already stores the submissions of every release')
+
+    cursor.execute('CREATE TABLE IF NOT EXISTS releases (date TEXT PRIMARY KEY)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS partitions (date TEXT PRIMARY KEY, filename TEXT)')
+    create_import_state_table(cursor)
+
+    #every variant name of every release, so that the web server can turn away a name that is in none of them without
+    #opening each release's file
+    if not list(cursor.execute('SELECT 1 FROM sqlite_master WHERE name=?', ['all_variant_names'])):
+        cursor.execute('CREATE TABLE all_variant_names (value TEXT PRIMARY KEY)')
+        #databases from before the table was added
+        for row in list(cursor.execute('SELECT filename FROM partitions')):
+            add_variant_names(cursor, row[0])
+
+def create_release_tables(cursor, temporal):
+    dated_tables = list(cursor.execute(
+        'SELECT name FROM sqlite_master WHERE name IN (?,?) AND type=?', ['submissions', 'encoded_submissions', 'table']
+    ))
+    if temporal and dated_tables:
+        raise ValueError(clinvar_db + ' already stores a full copy of the submissions for each release')
+
+    cursor.execute('CREATE TABLE IF NOT EXISTS releases (date TEXT PRIMARY KEY)')
+
+    for dimension_table in set(dimension_tables.values()):
+        cursor.execute('CREATE TABLE IF NOT EXISTS ' + dimension_table + ' (id INTEGER PRIMARY KEY, value TEXT UNIQUE)')
+
+    if list(cursor.execute('SELECT 1 FROM sqlite_master WHERE name=? AND type=?', ['comparisons', 'view'])):
+        cursor.execute('DROP VIEW comparisons')
+
+    #databases from before the comparisons referred to the submissions instead of copying them, or from before the keys
+    #of the submissions were copied into the pairs, have their pairs stored again once the submissions can be looked up
+    old_comparisons = False
+    if list(cursor.execute('SELECT 1 FROM sqlite_master WHERE name=? AND type=?', ['comparisons', 'table'])):
+        cursor.execute('ALTER TABLE comparisons RENAME TO old_comparisons')
+        old_comparisons = True
+    comparison_pair_columns = [row[1] for row in cursor.execute('PRAGMA table_info(comparison_pairs)')]
+    if comparison_pair_columns and 'star_level1' not in comparison_pair_columns:
+        cursor.execute('ALTER TABLE comparison_pairs RENAME TO old_comparisons')
+        old_comparisons = True
+
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS comparison_pairs (date TEXT, scv1 INTEGER, scv2 INTEGER, conflict_level INTEGER,' +
+        comparison_column_definitions + ', PRIMARY KEY (date, scv1, scv2))'
+    )
+
+    temporal = temporal or is_temporal(cursor)
+    if temporal:
+        if 'variant_name' in map(lambda row: row[1], cursor.execute('PRAGMA table_info(submission_versions)')):
+            cursor.execute('DROP VIEW submissions')
+            encode_table(cursor, 'submission_versions', ['valid_from TEXT', 'valid_to TEXT'], 'scv, valid_from')
+            cursor.execute('ALTER TABLE encoded_table RENAME TO submission_versions')
+
+        #store each version of a submission once, along with the first and last release that it appeared in
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS submission_versions (valid_from TEXT, valid_to TEXT,' +
+            encoded_submission_column_definitions + ', PRIMARY KEY (scv, valid_from))'
         )
-    ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS submission_versions__scv__valid_to ON submission_versions (scv, valid_to)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS submission_versions__valid_to ON submission_versions (valid_to)')
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS submissions AS
+            SELECT releases.date,''' + get_decoded_columns('submission_versions') + '''
+            FROM releases INNER JOIN submission_versions
+            ON releases.date BETWEEN submission_versions.valid_from AND submission_versions.valid_to
+        ''')
+    else:
+        if ('submissions',) in dated_tables:
+            cursor.execute('DROP VIEW IF EXISTS submission_versions')
+            encode_table(cursor, 'submissions', ['date TEXT'], 'date, scv')
+            cursor.execute('ALTER TABLE encoded_table RENAME TO encoded_submissions')
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS comparisons (
-            date TEXT,
-            variant_id TEXT,
-            variant_name TEXT,
-            rsid TEXT,
-            gene TEXT,
-            gene_type INTEGER,
-            normalized_gene TEXT,
-            normalized_gene_type INTEGER,
-
-            submitter1_id INTEGER,
-            submitter1_name TEXT,
-            submitter1_country_code TEXT,
-            submitter1_country_name TEXT,
-            rcv1 INTEGER,
-            scv1 INTEGER,
-            significance1 TEXT,
-            normalized_significance1 TEXT,
-            last_eval1 TEXT,
-            review_status1 TEXT,
-            star_level1 INTEGER,
-            condition1_name TEXT,
-            condition1_xrefs TEXT,
-            method1 TEXT,
-            normalized_method1 TEXT,
-            comment1 TEXT,
-
-            submitter2_id INTEGER,
-            submitter2_name TEXT,
-            scv2 INTEGER,
-            significance2 TEXT,
-            normalized_significance2 TEXT,
-            star_level2 INTEGER,
-            condition2_name TEXT,
-            normalized_method2 TEXT,
-
-            conflict_level INTEGER,
-
-            PRIMARY KEY (date, scv1, scv2)
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS encoded_submissions (date TEXT,' +
+            encoded_submission_column_definitions + ', PRIMARY KEY (date, scv))'
+        )
+        cursor.execute(
+            'CREATE VIEW IF NOT EXISTS submissions AS SELECT date,' + get_decoded_columns('encoded_submissions') +
+            ' FROM encoded_submissions'
+        )
+        #lets history-wide queries be written the same way for both layouts
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS submission_versions AS
+            SELECT date AS valid_from, date AS valid_to,''' + encoded_submission_column_names + ''' FROM encoded_submissions
+        ''')
+
+    if old_comparisons:
+        cursor.execute(
+            'INSERT OR REPLACE INTO comparison_pairs' +
+            ' SELECT old_comparisons.date, old_comparisons.scv1, old_comparisons.scv2, old_comparisons.conflict_level,' +
+            get_comparison_values('t1', 't2') + ' FROM old_comparisons' +
+            ' INNER JOIN submissions t1 ON t1.date=old_comparisons.date AND t1.scv=old_comparisons.scv1' +
+            ' INNER JOIN submissions t2 ON t2.date=old_comparisons.date AND t2.scv=old_comparisons.scv2'
         )
+        cursor.execute('DROP TABLE old_comparisons')
+
+    #the rest of the columns of the first submission are only looked up by the queries that use them
+    if temporal:
+        submission1 = (
+            'submission_versions WHERE scv=comparison_pairs.scv1' +
+            ' AND comparison_pairs.date BETWEEN valid_from AND valid_to'
+        )
+    else:
+        submission1 = 'encoded_submissions WHERE date=comparison_pairs.date AND scv=comparison_pairs.scv1'
+    cursor.execute('''
+        CREATE VIEW comparisons AS
+        SELECT
+            comparison_pairs.date,
+            (SELECT variant_id FROM ''' + submission1 + ''') AS variant_id,
+            (SELECT value FROM variant_names WHERE id=comparison_pairs.variant_name_id) AS variant_name,
+            (SELECT rsid FROM ''' + submission1 + ''') AS rsid,
+            (SELECT value FROM genes WHERE id=comparison_pairs.gene_id) AS gene,
+            comparison_pairs.gene_type,
+            (SELECT value FROM genes WHERE id=comparison_pairs.normalized_gene_id) AS normalized_gene,
+            comparison_pairs.normalized_gene_type,
+
+            comparison_pairs.submitter1_id,
+            (SELECT value FROM submitter_names WHERE id=comparison_pairs.submitter1_name_id) AS submitter1_name,
+            comparison_pairs.submitter1_country_code,
+            (SELECT submitter_country_name FROM ''' + submission1 + ''') AS submitter1_country_name,
+            (SELECT rcv FROM ''' + submission1 + ''') AS rcv1,
+            comparison_pairs.scv1,
+            (SELECT value FROM significances WHERE id=comparison_pairs.significance1_id) AS significance1,
+            (SELECT value FROM significances WHERE id=comparison_pairs.normalized_significance1_id) AS normalized_significance1,
+            (SELECT last_eval FROM ''' + submission1 + ''') AS last_eval1,
+            (SELECT review_status FROM ''' + submission1 + ''') AS review_status1,
+            comparison_pairs.star_level1,
+            (SELECT value FROM condition_names WHERE id=comparison_pairs.condition1_name_id) AS condition1_name,
+            (SELECT condition_xrefs FROM ''' + submission1 + ''') AS condition1_xrefs,
+            (SELECT value FROM methods WHERE id=comparison_pairs.method1_id) AS method1,
+            (SELECT value FROM methods WHERE id=comparison_pairs.normalized_method1_id) AS normalized_method1,
+            (SELECT comment FROM ''' + submission1 + ''') AS comment1,
+
+            comparison_pairs.submitter2_id,
+            (SELECT value FROM submitter_names WHERE id=comparison_pairs.submitter2_name_id) AS submitter2_name,
+            comparison_pairs.scv2,
+            (SELECT value FROM significances WHERE id=comparison_pairs.significance2_id) AS significance2,
+            (SELECT value FROM significances WHERE id=comparison_pairs.normalized_significance2_id) AS normalized_significance2,
+            comparison_pairs.star_level2,
+            (SELECT value FROM condition_names WHERE id=comparison_pairs.condition2_name_id) AS condition2_name,
+            (SELECT value FROM methods WHERE id=comparison_pairs.normalized_method2_id) AS normalized_method2,
+
+            comparison_pairs.conflict_level,
+
+            comparison_pairs.variant_name_id,
+            comparison_pairs.gene_id,
+            comparison_pairs.normalized_gene_id,
+            comparison_pairs.significance1_id,
+            comparison_pairs.normalized_significance1_id,
+            comparison_pairs.condition1_name_id,
+            comparison_pairs.method1_id,
+            comparison_pairs.normalized_method1_id,
+            comparison_pairs.significance2_id,
+            comparison_pairs.normalized_significance2_id,
+            comparison_pairs.condition2_name_id,
+            comparison_pairs.normalized_method2_id
+        FROM comparison_pairs
     ''')
 
     cursor.execute('''
@@ -123,6 +337,45 @@ def create_tables():
         )
     ''')
 
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clinvarset_fingerprints (
+            date TEXT,
+            fingerprint INTEGER,
+            rcv INTEGER,
+            position INTEGER,
+            shared INTEGER,
+            PRIMARY KEY (date, fingerprint)
+        )
+    ''')
+    #databases from before the position of each ClinVarSet in its file was recorded, whose ClinVarSets are all parsed
+    #again by the next incremental import
+    if 'position' not in [row[1] for row in cursor.execute('PRAGMA table_info(clinvarset_fingerprints)')]:
+        cursor.execute('ALTER TABLE clinvarset_fingerprints ADD COLUMN position INTEGER')
+        cursor.execute('ALTER TABLE clinvarset_fingerprints ADD COLUMN shared INTEGER')
+
+    #the submissions of a release are kept here from when they are parsed until the release is stored, along with the
+    #position of their ClinVarSet in the file
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS parsed_submissions (date TEXT,' + submission_column_definitions +
+        ', position INTEGER, PRIMARY KEY (date, scv, position))'
+    )
+
+    create_import_state_table(cursor)
+
+    #databases from before the releases table was added
+    if not list(cursor.execute('SELECT 1 FROM releases LIMIT 1')):
+        cursor.execute('INSERT INTO releases SELECT DISTINCT date FROM comparison_pairs')
+
+def create_tables(temporal = False, partitioned = False):
+    db = connect()
+    cursor = db.cursor()
+    if partitioned or is_partitioned(cursor):
+        create_catalog_tables(cursor, temporal)
+    else:
+        create_release_tables(cursor, temporal)
+    db.commit()
+    db.close()
+
 def get_gene_type(genes, small_variant):
     if len(genes) == 0:
         return 0 #intergenic
@@ -133,6 +386,28 @@ def get_gene_type(genes, small_variant):
     else:
         return 3 #multiple genes because variant is large
 
+#the same condition names and xrefs come up again and again, in a release and from one release to the next
+@lru_cache(maxsize=mondo_matches_per_worker)
+def get_mondo_matches(condition_name, condition_xrefs):
+    return get_mondo().most_specific_matches(condition_name, condition_xrefs)
+
+def get_condition_xrefs(condition_name, condition_xrefs):
+    #names are matched regardless of case
+    condition_xrefs |= get_mondo_matches(condition_name.lower(), frozenset(condition_xrefs))
+    return ';'.join(sorted(condition_xrefs))
+
+def get_submitter_country(submitter_id):
+    submitter_country_code = get_submitter_country_codes().get(submitter_id, '')
+    if submitter_country_code:
+        submitter_country = countries.get(alpha_3=submitter_country_code)
+        if hasattr(submitter_country, 'common_name'):
+            submitter_country_name = submitter_country.common_name
+        else:
+            submitter_country_name = submitter_country.name
+    else:
+        submitter_country_name = ''
+    return submitter_country_code, submitter_country_name
+
 def get_submissions(date, set_xml):
     set_el = ElementTree.fromstring(set_xml)
     submissions = []
@@ -220,8 +495,7 @@ def get_submissions(date, set_xml):
             condition_xrefs.add('UNIPROT:' + condition_id)
         elif condition_db == 'efo':
             condition_xrefs.add('EFO:' + condition_id)
-    condition_xrefs |= mondo.most_specific_matches(condition_name, condition_xrefs)
-    condition_xrefs = ';'.join(sorted(condition_xrefs))
+    condition_xrefs = get_condition_xrefs(condition_name, condition_xrefs)
 
     for assertion_el in set_el.findall('./ClinVarAssertion'):
         scv_el = assertion_el.find('./ClinVarAccession[@Type="SCV"]')
@@ -236,18 +510,10 @@ def get_submissions(date, set_xml):
 
         submitter_id = int(scv_el.attrib['OrgID']) if scv_el.attrib.get('OrgID') else 500139 #missing in old versions
         submitter_name = submission_id_el.get('submitter', '') if submission_id_el != None else 'ClinVar Staff' #missing in old versions
-        submitter_country_code = submitter_country_codes[submitter_id] if submitter_id in submitter_country_codes else ''
-        if submitter_country_code:
-            submitter_country = countries.get(alpha_3=submitter_country_code)
-            if hasattr(submitter_country, 'common_name'):
-                submitter_country_name = submitter_country.common_name
-            else:
-                submitter_country_name = submitter_country.name
-        else:
-            submitter_country_name = ''
+        submitter_country_code, submitter_country_name = get_submitter_country(submitter_id)
 
         significance = description_el.text.lower() if description_el != None else 'not provided'
-        normalized_significance = nonstandard_significance_term_map.get(significance, significance)
+        normalized_significance = get_nonstandard_significance_term_map().get(significance, significance)
         last_eval = significance_el.attrib.get('DateLastEvaluated', '') #missing in old versions
         review_status = review_status_el.text if review_status_el != None else '' #missing in old versions
         method = method_el.text if method_el != None else 'not provided' #missing in old versions
@@ -292,106 +558,670 @@ def get_submissions(date, set_xml):
 
     return submissions
 
-def import_file(filename):
-    with open(filename, 'r+b') as f:
-        doc = mmap(f.fileno(), 0)
-        for ev, el in ElementTree.iterparse(doc, events=['start']):
+def get_row_size(row):
+    return getsizeof(row) + sum(map(getsizeof, row))
+
+def get_submission_batch(date, clinvarsets):
+    submissions = []
+    fingerprints = []
+    for position, fingerprint, set_xml in clinvarsets:
+        set_submissions = get_submissions(date, set_xml)
+        if set_submissions:
+            submissions += [submission + (position,) for submission in set_submissions]
+            fingerprints.append((date, fingerprint, set_submissions[0][12], position, 0)) #rcv
+    #the batch takes up its XML until it is finished and its submissions until they are written
+    size = get_xml_size(clinvarsets) + sum(map(get_row_size, submissions)) + sum(map(get_row_size, fingerprints))
+    return submissions, fingerprints, size, get_private_memory()
+
+def get_xml_size(clinvarsets):
+    return sum(len(set_xml) for position, fingerprint, set_xml in clinvarsets)
+
+def get_fingerprint(set_xml):
+    return int.from_bytes(blake2b(set_xml, digest_size=8).digest(), 'big', signed=True)
+
+def open_release(filename):
+    return gzip.open(filename) if filename.endswith('.gz') else open(filename, 'rb')
+
+@contextmanager
+def read_release(filename):
+    #decompress in a separate process if possible so that decompression gets its own core
+    decompressor = filename.endswith('.gz') and (which('pigz') or which('gzip'))
+    if not decompressor:
+        with open_release(filename) as f:
+            yield f
+        return
+
+    process = Popen([decompressor, '-dc', filename], stdout=PIPE)
+    try:
+        yield process.stdout
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode:
+        raise CalledProcessError(returncode, process.args)
+
+def get_release_date(filename):
+    with open_release(filename) as f:
+        for ev, el in ElementTree.iterparse(f, events=['start']):
             if el.tag == 'ReleaseSet':
-                date = el.attrib['Dated']
+                return el.attrib['Dated']
+
+def read_clinvarsets(f, block_size = 16 * 1024 * 1024):
+    #hack the ClinVar XML file into pieces to parse it in parallel, one block at a time to keep memory usage flat
+    start_tag = b'<ClinVarSet '
+    end_tag = b'</ClinVarSet>'
+    buf = b''
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return
+        buf += block
+        pos = 0
+        while True:
+            start = buf.find(start_tag, pos)
+            if start == -1:
+                pos = max(pos, len(buf) - len(start_tag)) #keep any partial tag for the next block
                 break
-        #hack the ClinVar XML file into pieces to parse it in parallel (if memory permits)
-        clinvarsets = re.findall(b'<ClinVarSet .+?</ClinVarSet>', doc, re.DOTALL)
-    if virtual_memory().available >= getsize(filename) * 2:
-        submission_sets = Pool().map(partial(get_submissions, date), clinvarsets)
-    else:
-        submission_sets = map(partial(get_submissions, date), clinvarsets)
-    submissions = [submission for submission_set in submission_sets for submission in submission_set]
+            end = buf.find(end_tag, start)
+            if end == -1:
+                pos = start
+                break
+            end += len(end_tag)
+            yield buf[start:end]
+            pos = end
+        buf = buf[pos:]
 
-    #do all the database imports at once to minimize the time that we hold the database lock
-    db = connect()
-    cursor = db.cursor()
+def read_changed_clinvarsets(clinvarsets, date, previous_fingerprints, unchanged_fingerprints):
+    #an SCV that appears in several ClinVarSets is taken from the last of them, so each ClinVarSet is numbered in file order
+    for position, set_xml in enumerate(clinvarsets):
+        fingerprint = get_fingerprint(set_xml)
+        if fingerprint in previous_fingerprints:
+            unchanged_fingerprints.append((date, fingerprint, previous_fingerprints[fingerprint], position, 0))
+        else:
+            yield position, fingerprint, set_xml
+
+class InFlight():
+    #bounds the number of batches that are being worked on or waiting to be written and the memory that they take up,
+    #but always lets one batch through so that a batch that is larger than the budget can still be imported
+    def __init__(self, batches, memory_budget, workers, bytes_per_unit, worker_memory):
+        self.batches = batches
+        self.memory_budget = memory_budget
+        self.workers = workers
+        #what a batch takes up for each unit of its input (a byte of XML or a pair of submissions) and what a worker
+        #takes up itself, which start out as what the first batch took up and then follow what the workers report
+        self.bytes_per_unit = bytes_per_unit
+        self.worker_memory = worker_memory
+        self.measured_units = 0
+        self.measured_size = 0
+        self.sizes = deque()
+        self.used = 0
+        self.condition = Condition()
+
+    def estimate(self, units):
+        return units * self.bytes_per_unit
+
+    def fits(self, units):
+        #the workers take up their own memory whether or not they are working on a batch
+        with self.condition:
+            return not self.sizes or (
+                len(self.sizes) < self.batches and
+                self.used + self.estimate(units) <= self.memory_budget - self.workers * self.worker_memory
+            )
+
+    def acquire(self, units):
+        with self.condition:
+            self.condition.wait_for(lambda: self.fits(units))
+            self.sizes.append((units, self.estimate(units)))
+            self.used += self.estimate(units)
+
+    def release(self, size, worker_memory):
+        #the batches are finished in the order that they were started
+        with self.condition:
+            units, estimated_size = self.sizes.popleft()
+            self.used -= estimated_size
+            self.measured_units += units
+            self.measured_size += size
+            self.bytes_per_unit = self.measured_size / max(self.measured_units, 1)
+            self.worker_memory = max(self.worker_memory, worker_memory)
+            self.condition.notify_all()
+
+def read_batches(iterable, batch_size, in_flight):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        #released when the batch's results have been consumed
+        in_flight.acquire(get_xml_size(batch))
+        yield batch
+
+def measure_batch(fn, batch):
+    #work on the first batch in a worker of its own to find out what a worker and a batch take up before the rest of the
+    #workers are started
+    with Pool(1) as pool:
+        return pool.apply(fn, [batch])
+
+def get_worker_count(memory_budget, worker_memory, batch_size):
+    #one worker per core, unless the budget cannot hold that many workers and their batches in flight
+    worker_size = worker_memory + batches_in_flight_per_worker * batch_size
+    return max(1, min(cpu_count(), memory_budget // max(worker_size, 1)))
+
+def get_conflict_level(significance1, normalized_significance1, significance2, normalized_significance2):
+    if significance1 == significance2:
+        return 0
+    if normalized_significance1 == 'not provided' or normalized_significance2 == 'not provided':
+        return 0
+
+    if normalized_significance1 == normalized_significance2:
+        return 1
+
+    normalized_significances = {normalized_significance1, normalized_significance2}
+
+    if normalized_significances in [{'benign', 'likely benign'}, {'pathogenic', 'likely pathogenic'}]:
+        return 2
+
+    if normalized_significances in [{'benign', 'uncertain significance'}, {'likely benign', 'uncertain significance'}]:
+        return 3
 
+    if (
+        normalized_significances & {'pathogenic', 'likely pathogenic'} and
+        normalized_significances & {'benign', 'likely benign', 'uncertain significance'}
+    ):
+        return 5
+
+    return 4
+
+def get_comparison_batch(date, variants):
+    comparisons = []
+    for submissions in variants:
+        #compare every submission on the variant to every submission on the variant, including itself
+        for scv1, significance1, normalized_significance1, *columns1 in submissions:
+            for scv2, significance2, normalized_significance2, *columns2 in submissions:
+                if scv1 == scv2:
+                    conflict_level = -1
+                else:
+                    conflict_level = get_conflict_level(
+                        significance1, normalized_significance1, significance2, normalized_significance2
+                    )
+                comparisons.append(
+                    (date, scv1, scv2, conflict_level, *columns1, *columns2[0:submission2_comparison_column_count])
+                )
+    #the pairs all have the same shape
+    size = len(comparisons) * get_row_size(comparisons[0]) if comparisons else 0
+    return comparisons, size, get_private_memory()
+
+def get_pair_count(variants):
+    return sum(len(submissions) ** 2 for submissions in variants)
+
+def read_variants(rows):
+    for variant_name_id, variant_rows in groupby(rows, lambda row: row[0]):
+        yield [row[1:] for row in variant_rows]
+
+def write_comparisons(cursor, comparisons):
+    #the cursor itself is still reading the submissions
+    placeholders = ','.join('?' * (4 + len(comparison_columns) + submission2_comparison_column_count))
+    cursor.connection.executemany('INSERT OR REPLACE INTO comparison_pairs VALUES (' + placeholders + ')', comparisons)
+
+def create_comparisons(cursor, date, workers, memory_budget, changed_only = False):
+    query = (
+        'SELECT variant_name_id, scv, significance, normalized_significance,' +
+        ','.join(name for name, name1, name2 in comparison_columns) + ' FROM submissions WHERE date=?'
+    )
+
+    if changed_only:
+        query += ' AND variant_name_id IN (SELECT variant_name_id FROM changed_variants)'
+
+    query += ' ORDER BY variant_name_id'
+
+    #pair up the submissions on each variant in the workers while the pairs of the previous variants are written
+    variants = read_variants(cursor.execute(query, [date]))
+    variant_batch = list(islice(variants, variants_per_batch))
+    if not variant_batch:
+        return
+    comparisons, size, worker_memory = measure_batch(partial(get_comparison_batch, date), variant_batch)
+    write_comparisons(cursor, comparisons)
+    workers = workers or get_worker_count(memory_budget, worker_memory, size)
+    in_flight = InFlight(
+        workers * batches_in_flight_per_worker, memory_budget, workers, size / get_pair_count(variant_batch), worker_memory
+    )
+    pending_batches = deque()
+
+    def write_pending_batch():
+        comparisons, size, worker_memory = pending_batches.popleft().get()
+        write_comparisons(cursor, comparisons)
+        in_flight.release(size, worker_memory)
+
+    with Pool(workers) as pool:
+        while True:
+            variant_batch = list(islice(variants, variants_per_batch))
+            if not variant_batch:
+                break
+            pairs = get_pair_count(variant_batch)
+            while not in_flight.fits(pairs):
+                write_pending_batch()
+            in_flight.acquire(pairs)
+            pending_batches.append(pool.apply_async(get_comparison_batch, [date, variant_batch]))
+        while pending_batches:
+            write_pending_batch()
+
+def get_mondo_clinvar_relationships(date, conditions):
+    mondo = get_mondo()
+    #associate each ClinVar condition name with the Mondo terms that it matched and all of their ancestors, once each
+    for clinvar_name, rows in groupby(conditions, key=lambda row: row[0]):
+        mondo_xrefs = set()
+        for row in rows:
+            for xref in row[1].split(';'):
+                if xref.startswith('MONDO:'):
+                    mondo_xrefs.add(xref)
+                    mondo_xrefs |= mondo.ancestors(xref)
+        for mondo_xref in mondo_xrefs:
+            if mondo_xref not in mondo.mondo_xref_to_name:
+                continue #this is a deprecated term
+            yield [date, int(mondo_xref[len('MONDO:'):]), mondo.mondo_xref_to_name[mondo_xref], clinvar_name]
+
+def create_mondo_clinvar_relationships(cursor, date):
+    conditions = list(cursor.execute(
+        'SELECT DISTINCT condition_name, condition_xrefs FROM submissions WHERE date=? ORDER BY condition_name',
+        [date]
+    ))
+    cursor.execute('DELETE FROM mondo_clinvar_relationships WHERE date=?', [date]) #the release may be imported again
     cursor.executemany(
-        'INSERT OR REPLACE INTO submissions VALUES (' + ','.join('?' * len(submissions[0])) + ')', submissions
+        'INSERT INTO mondo_clinvar_relationships VALUES (?,?,?,?)',
+        get_mondo_clinvar_relationships(date, conditions)
     )
 
-    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__date ON submissions (date)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__variant_name ON submissions (variant_name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS mondo_clinvar_relationships__date ON mondo_clinvar_relationships (date)')
 
-    cursor.execute('''
-        INSERT OR REPLACE INTO comparisons
-        SELECT
-            t1.*,
-            t2.submitter_id,
-            t2.submitter_name,
-            t2.scv,
-            t2.significance,
-            t2.normalized_significance,
-            t2.star_level,
-            t2.condition_name,
-            t2.normalized_method,
-            CASE
-                WHEN t1.scv=t2.scv THEN -1
-
-                WHEN t1.significance=t2.significance THEN 0
-                WHEN t1.normalized_significance="not provided" OR t2.normalized_significance="not provided" THEN 0
-
-                WHEN t1.normalized_significance=t2.normalized_significance THEN 1
-
-                WHEN t1.normalized_significance="benign" AND t2.normalized_significance="likely benign" THEN 2
-                WHEN t1.normalized_significance="likely benign" AND t2.normalized_significance="benign" THEN 2
-                WHEN t1.normalized_significance="pathogenic" AND t2.normalized_significance="likely pathogenic" THEN 2
-                WHEN t1.normalized_significance="likely pathogenic" AND t2.normalized_significance="pathogenic" THEN 2
-
-                WHEN t1.normalized_significance IN ("benign", "likely benign") AND t2.normalized_significance="uncertain significance" THEN 3
-                WHEN t1.normalized_significance="uncertain significance" AND t2.normalized_significance IN ("benign", "likely benign") THEN 3
-
-                WHEN t1.normalized_significance IN ("benign", "likely benign", "uncertain significance") AND t2.normalized_significance IN ("pathogenic", "likely pathogenic") THEN 5
-                WHEN t1.normalized_significance IN ("pathogenic", "likely pathogenic") AND t2.normalized_significance IN ("benign", "likely benign", "uncertain significance") THEN 5
-
-                ELSE 4
-            END AS conflict_level
-        FROM submissions t1 INNER JOIN submissions t2
-        ON t1.date=? AND t2.date=? AND t1.variant_name=t2.variant_name
-        ORDER BY conflict_level, variant_name
-    ''', [date, date])
-
-    for row in list(cursor.execute('SELECT DISTINCT condition_name, condition_xrefs FROM submissions WHERE date=?', [date])):
-        clinvar_name = row[0]
-        xrefs = row[1].split(';')
-        for xref in xrefs:
-            if xref.startswith('MONDO:'):
-                mondo_name = mondo.mondo_xref_to_name[xref]
-                mondo_id = xref[len('MONDO:'):]
-                cursor.execute(
-                    'INSERT OR REPLACE INTO mondo_clinvar_relationships VALUES (?,?,?,?)',
-                    [date, mondo_id, mondo_name, clinvar_name]
+def collect_release_submissions(cursor, date, previous_date):
+    #the submissions of each ClinVarSet of the release, whether parsed or carried forward, by the ClinVarSet's position
+    cursor.execute(
+        'CREATE TEMP TABLE clinvarset_submissions (date TEXT,' + submission_column_definitions + ', position INTEGER)'
+    )
+    cursor.execute('INSERT INTO clinvarset_submissions SELECT * FROM parsed_submissions WHERE date=?', [date])
+
+    if previous_date:
+        #an unchanged ClinVarSet only shared none of its SCVs with other ClinVarSets in the previous release, so all
+        #of its submissions were stored under its RCV
+        cursor.execute('DROP TABLE IF EXISTS unchanged_rcvs')
+        cursor.execute('CREATE TEMP TABLE unchanged_rcvs (rcv INTEGER PRIMARY KEY, position INTEGER)')
+        cursor.execute(
+            '''
+                INSERT OR IGNORE INTO unchanged_rcvs SELECT rcv, position FROM clinvarset_fingerprints
+                WHERE date=? AND fingerprint IN (SELECT fingerprint FROM clinvarset_fingerprints WHERE date=? AND shared=0)
+            ''',
+            [date, previous_date]
+        )
+        cursor.execute(
+            'INSERT INTO clinvarset_submissions SELECT ?,' + submission_column_names +
+            ', (SELECT position FROM unchanged_rcvs WHERE rcv=submissions.rcv)' +
+            ' FROM submissions WHERE date=? AND rcv IN (SELECT rcv FROM unchanged_rcvs)',
+            [date, previous_date]
+        )
+
+    #an SCV that appears in several ClinVarSets is taken from the last of them, as when the whole file is parsed
+    cursor.execute('CREATE TEMP TABLE release_submissions (date TEXT,' + submission_column_definitions + ', PRIMARY KEY (scv))')
+    cursor.execute(
+        '''
+            INSERT INTO release_submissions SELECT date,''' + submission_column_names + ''' FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY scv ORDER BY position DESC) AS rank FROM clinvarset_submissions
+            ) WHERE rank=1
+        '''
+    )
+
+    #the next release has to parse the ClinVarSets that share an SCV again even if they do not change, because the
+    #submissions that lost out to another ClinVarSet are not stored
+    cursor.execute(
+        '''
+            UPDATE clinvarset_fingerprints SET shared=1 WHERE date=? AND position IN (
+                SELECT position FROM clinvarset_submissions WHERE scv IN (
+                    SELECT scv FROM clinvarset_submissions GROUP BY scv HAVING COUNT(*)>1
                 )
+            )
+        ''',
+        [date]
+    )
+    cursor.execute('DROP TABLE clinvarset_submissions')
 
-    cursor.execute('CREATE INDEX IF NOT EXISTS mondo_clinvar_relationships__date ON mondo_clinvar_relationships (date)')
+def refresh_carried_submissions(cursor, date):
+    #the lookup tables and Mondo may have been updated since the carried submissions were parsed
+    for row in list(cursor.execute('SELECT DISTINCT submitter_id FROM release_submissions WHERE date=?', [date])):
+        submitter_id = row[0]
+        submitter_country_code, submitter_country_name = get_submitter_country(submitter_id)
+        cursor.execute(
+            '''
+                UPDATE release_submissions SET submitter_country_code=?, submitter_country_name=?
+                WHERE date=? AND submitter_id=? AND (submitter_country_code!=? OR submitter_country_name!=?)
+            ''',
+            [submitter_country_code, submitter_country_name, date, submitter_id, submitter_country_code, submitter_country_name]
+        )
 
-    #add rows to associate ClinVar condition names with all of their Mondo ancestors
-    for row in list(cursor.execute('SELECT mondo_id, clinvar_name FROM mondo_clinvar_relationships WHERE date=?', [date])):
-        mondo_id = row[0]
-        clinvar_name = row[1]
-        for ancestor_xref in mondo.ancestors('MONDO:' + str(mondo_id).zfill(7)):
-            if ancestor_xref not in mondo.mondo_xref_to_name:
-                continue #this is a deprecated term
-            ancestor_id = ancestor_xref[len('MONDO:'):]
-            ancestor_name = mondo.mondo_xref_to_name[ancestor_xref]
+    for row in list(cursor.execute('SELECT DISTINCT significance FROM release_submissions WHERE date=?', [date])):
+        significance = row[0]
+        normalized_significance = get_nonstandard_significance_term_map().get(significance, significance)
+        cursor.execute(
+            'UPDATE release_submissions SET normalized_significance=? WHERE date=? AND significance=? AND normalized_significance!=?',
+            [normalized_significance, date, significance, normalized_significance]
+        )
+
+    for row in list(cursor.execute('SELECT DISTINCT condition_name, condition_xrefs FROM release_submissions WHERE date=?', [date])):
+        condition_name = row[0]
+        old_condition_xrefs = row[1]
+        condition_xrefs = set(filter(lambda xref: xref and not xref.startswith('MONDO:'), old_condition_xrefs.split(';')))
+        condition_xrefs = get_condition_xrefs(condition_name, condition_xrefs)
+        if condition_xrefs != old_condition_xrefs:
             cursor.execute(
-                'INSERT OR REPLACE INTO mondo_clinvar_relationships VALUES (?,?,?,?)',
-                [date, ancestor_id, ancestor_name, clinvar_name]
+                'UPDATE release_submissions SET condition_xrefs=? WHERE date=? AND condition_name=? AND condition_xrefs=?',
+                [condition_xrefs, date, condition_name, old_condition_xrefs]
             )
 
-    db.commit()
+def find_changed_variants(cursor, date, previous_date):
+    cursor.execute('DROP TABLE IF EXISTS changed_variants')
+    cursor.execute('CREATE TEMP TABLE changed_variants (variant_name_id INTEGER PRIMARY KEY)')
+    #a variant has changed if any of its submissions were added, removed or modified
+    cursor.execute(
+        '''
+            INSERT OR IGNORE INTO changed_variants
+            SELECT variant_name_id FROM (
+                SELECT ''' + encoded_submission_column_names + ''' FROM submissions WHERE date=:date
+                EXCEPT SELECT ''' + encoded_submission_column_names + ''' FROM submissions WHERE date=:previous_date
+            )
+            UNION
+            SELECT variant_name_id FROM (
+                SELECT ''' + encoded_submission_column_names + ''' FROM submissions WHERE date=:previous_date
+                EXCEPT SELECT ''' + encoded_submission_column_names + ''' FROM submissions WHERE date=:date
+            )
+        ''',
+        {'date': date, 'previous_date': previous_date}
+    )
+
+def carry_forward_comparisons(cursor, date, previous_date):
+    cursor.execute(
+        '''
+            INSERT OR REPLACE INTO comparison_pairs
+            SELECT ?, scv1, scv2, conflict_level,''' + comparison_column_names + ''' FROM comparison_pairs
+            WHERE date=? AND variant_name_id NOT IN (SELECT variant_name_id FROM changed_variants)
+        ''',
+        [date, previous_date]
+    )
+
+def encode_release(cursor):
+    intern_dimensions(cursor, 'release_submissions')
+    cursor.execute(
+        'CREATE TEMP TABLE encoded_release_submissions (date TEXT,' +
+        encoded_submission_column_definitions + ', PRIMARY KEY (scv))'
+    )
+    cursor.execute(
+        'INSERT INTO encoded_release_submissions SELECT date,' + get_encoded_values('release_submissions') +
+        ' FROM release_submissions'
+    )
+
+def add_release(cursor, date):
+    cursor.execute('INSERT OR IGNORE INTO releases VALUES (?)', [date])
+
+def merge_release(cursor, date):
+    latest_date = list(cursor.execute('SELECT MAX(date) FROM releases'))[0][0]
+    if latest_date and date < latest_date:
+        raise ValueError('releases must be imported in chronological order, but ' + latest_date + ' has already been imported')
+
+    if date == latest_date:
+        #importing the latest release again replaces it
+        latest_date = list(cursor.execute('SELECT MAX(date) FROM releases WHERE date<?', [date]))[0][0]
+        cursor.execute('DELETE FROM submission_versions WHERE valid_from=?', [date])
+        cursor.execute('UPDATE submission_versions SET valid_to=? WHERE valid_to=?', [latest_date, date])
+        cursor.execute('DELETE FROM releases WHERE date=?', [date])
+
+    add_release(cursor, date)
+
+    #extend the versions that did not change since the latest release and add a version for everything else
+    unchanged = ' AND '.join(
+        'encoded_release_submissions.' + name + ' IS submission_versions.' + name
+        for name in encoded_submission_column_names.split(',') if name != 'scv'
+    )
+    cursor.execute(
+        '''
+            UPDATE submission_versions SET valid_to=:date WHERE valid_to=:latest_date AND EXISTS (
+                SELECT 1 FROM encoded_release_submissions
+                WHERE encoded_release_submissions.scv=submission_versions.scv AND ''' + unchanged + '''
+            )
+        ''',
+        {'date': date, 'latest_date': latest_date}
+    )
+    cursor.execute(
+        '''
+            INSERT INTO submission_versions SELECT date, date,''' + encoded_submission_column_names + '''
+            FROM encoded_release_submissions WHERE NOT EXISTS (
+                SELECT 1 FROM submission_versions WHERE scv=encoded_release_submissions.scv AND valid_to=:date
+            )
+        ''',
+        {'date': date}
+    )
+
+def replace_release(cursor, date):
+    cursor.execute('DELETE FROM encoded_submissions WHERE date=?', [date])
+    cursor.execute('INSERT INTO encoded_submissions SELECT * FROM encoded_release_submissions')
+    add_release(cursor, date)
+
+def remove_release(cursor, date):
+    for table in [
+        'encoded_submissions', 'comparison_pairs', 'mondo_clinvar_relationships', 'clinvarset_fingerprints', 'releases',
+        'import_state'
+    ]:
+        cursor.execute('DELETE FROM ' + table + ' WHERE date=?', [date])
+
+def get_import_stage(cursor, date):
+    rows = list(cursor.execute('SELECT stage FROM import_state WHERE date=?', [date]))
+    return rows[0][0] if rows else None
+
+def set_import_stage(cursor, date, filename, stage):
+    cursor.execute('INSERT OR REPLACE INTO import_state VALUES (?,?,?)', [date, basename(filename), stage])
+
+def is_imported(cursor, date):
+    #a release that was imported before the import state was recorded is only listed in the releases table
+    return bool(list(cursor.execute(
+        'SELECT 1 FROM releases WHERE date=? AND date NOT IN (SELECT date FROM import_state WHERE stage NOT IN (?,?))',
+        [date] + complete_import_stages
+    )))
+
+def add_variant_names(cursor, filename):
+    cursor.execute('ATTACH DATABASE ? AS clinvar_release', [filename])
+    cursor.execute('INSERT OR IGNORE INTO all_variant_names SELECT value FROM clinvar_release.variant_names')
+    cursor.connection.commit() #databases cannot be detached in a transaction
+    cursor.execute('DETACH DATABASE clinvar_release')
+
+def add_partition(date, filename, release_filename):
+    #the web server only sees the release once its file is complete
+    db = connect()
+    cursor = db.cursor()
+    with write_lock():
+        add_variant_names(cursor, filename)
+        cursor.execute('INSERT OR REPLACE INTO partitions VALUES (?,?)', [date, filename])
+        add_release(cursor, date)
+        set_import_stage(cursor, date, release_filename, 'imported')
+        db.commit()
+    db.close()
+
+def write_submissions(db, database, insert_query, submissions, fingerprints):
+    with write_lock(database):
+        db.executemany(insert_query, submissions)
+        db.executemany('INSERT OR REPLACE INTO clinvarset_fingerprints VALUES (?,?,?,?,?)', fingerprints)
+        db.commit()
+
+def parse_release(db, database, filename, date, previous_date, workers, memory_budget):
+    cursor = db.cursor()
+
+    #start over from anything that an interrupted import of the release left behind
+    with write_lock(database):
+        cursor.execute('DELETE FROM parsed_submissions WHERE date=?', [date])
+        cursor.execute('DELETE FROM clinvarset_fingerprints WHERE date=?', [date])
+        cursor.execute('DELETE FROM import_state WHERE date=?', [date])
+        db.commit()
+
+    insert_query = 'INSERT OR REPLACE INTO parsed_submissions VALUES (?,' + ','.join('?' * len(submission_columns)) + ',?)'
+
+    #only parse the ClinVarSets that changed since the last complete release and carry the rest forward
+    previous_fingerprints = dict(
+        cursor.execute('SELECT fingerprint, rcv FROM clinvarset_fingerprints WHERE date=? AND shared=0', [previous_date])
+    ) if previous_date else {}
+    unchanged_fingerprints = []
+
+    #the workers are forked with the lookup tables that they need already loaded, so that they share them
+    get_nonstandard_significance_term_map()
+    get_submitter_country_codes()
+    get_mondo()
+
+    uncommitted_submissions = []
+    uncommitted_fingerprints = []
+    with read_release(filename) as f:
+        clinvarsets = read_changed_clinvarsets(read_clinvarsets(f), date, previous_fingerprints, unchanged_fingerprints)
+        clinvarset_batch = list(islice(clinvarsets, clinvarsets_per_batch))
+        if clinvarset_batch:
+            uncommitted_submissions, uncommitted_fingerprints, size, worker_memory = measure_batch(
+                partial(get_submission_batch, date), clinvarset_batch
+            )
+            workers = workers or get_worker_count(memory_budget, worker_memory, size)
+            in_flight = InFlight(
+                workers * batches_in_flight_per_worker, memory_budget, workers,
+                size / max(get_xml_size(clinvarset_batch), 1), worker_memory
+            )
+            with Pool(workers) as pool:
+                clinvarset_batches = read_batches(clinvarsets, clinvarsets_per_batch, in_flight)
+                #write the parsed submissions while the workers parse the next batches, in transactions of bounded size
+                #(in file order, because an SCV that appears in several ClinVarSets is replaced by the last one)
+                for submission_batch, fingerprint_batch, size, worker_memory in pool.imap(
+                    partial(get_submission_batch, date), clinvarset_batches
+                ):
+                    in_flight.release(size, worker_memory)
+                    uncommitted_submissions += submission_batch
+                    uncommitted_fingerprints += fingerprint_batch
+                    if len(uncommitted_submissions) >= submissions_per_transaction:
+                        write_submissions(db, database, insert_query, uncommitted_submissions, uncommitted_fingerprints)
+                        uncommitted_submissions = []
+                        uncommitted_fingerprints = []
+    write_submissions(db, database, insert_query, uncommitted_submissions, uncommitted_fingerprints + unchanged_fingerprints)
+
+    with write_lock(database):
+        set_import_stage(cursor, date, filename, 'parsed')
+        db.commit()
+
+def import_file(filename, incremental = False, workers = None, memory_budget = None, resume = False):
+    date = get_release_date(filename)
+    #leave room for everything else that runs on the host, such as other imports
+    memory_budget = memory_budget or get_available_memory() // 2
+
+    db = connect()
+    cursor = db.cursor()
+    if resume and is_imported(cursor, date):
+        print('Skipping ' + date + ', which has already been imported')
+        db.close()
+        return
+    previous_date = incremental and list(cursor.execute('SELECT MAX(date) FROM releases WHERE date<?', [date]))[0][0]
+
+    #a release that is stored in a file of its own starts from a copy of the previous release's file, unless an
+    #interrupted import of it is being resumed
+    partitioned = is_partitioned(cursor)
+    database = clinvar_db
+    if partitioned:
+        database = get_partition_filename(date)
+        previous_database = previous_date and list(
+            cursor.execute('SELECT filename FROM partitions WHERE date=?', [previous_date])
+        )[0][0]
+        db.close()
+        db = None
+        if resume and exists(database):
+            db = connect(database)
+            create_release_tables(db.cursor(), False)
+            if get_import_stage(db.cursor(), date) not in ['parsed'] + complete_import_stages:
+                db.close()
+                db = None
+        if not db and previous_database:
+            #copy under another name first so that an interrupted copy is not mistaken for the release's file
+            copyfile(previous_database, database + '.tmp')
+            replace(database + '.tmp', database)
+        db = db or connect(database)
+        cursor = db.cursor()
+        create_release_tables(cursor, False)
+
+    #anything that is not known to have got further than parsing is imported again from where it is known to have got
+    stage = resume and get_import_stage(cursor, date)
+    if stage in complete_import_stages and not partitioned:
+        #the release would have been skipped if it had been stored, so its stage cannot be trusted (create-indexes.py used
+        #to mark releases that were only parsed as indexed)
+        stage = None
+    if stage not in ['parsed'] + complete_import_stages:
+        parse_release(db, database, filename, date, previous_date, workers, memory_budget)
+        stage = 'parsed'
+
+    if stage not in complete_import_stages:
+        #encode the text columns of the parsed release and store it all at once, so that the web server never sees
+        #part of a release
+        with write_lock(database):
+            collect_release_submissions(cursor, date, previous_date)
+            if previous_date:
+                refresh_carried_submissions(cursor, date)
+            encode_release(cursor)
+            if is_temporal(cursor):
+                merge_release(cursor, date)
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS submission_versions__variant_name_id ON submission_versions (variant_name_id)'
+                )
+            else:
+                replace_release(cursor, date)
+                cursor.execute(
+                    'CREATE INDEX IF NOT EXISTS encoded_submissions__date__variant_name_id ON encoded_submissions (date, variant_name_id)'
+                )
+            #the pairs of a release that is imported again are made anew, as the submissions that they refer to are
+            cursor.execute('DELETE FROM comparison_pairs WHERE date=?', [date])
+            if previous_date:
+                find_changed_variants(cursor, date, previous_date)
+                carry_forward_comparisons(cursor, date, previous_date)
+                create_comparisons(cursor, date, workers, memory_budget, changed_only=True)
+            else:
+                create_comparisons(cursor, date, workers, memory_budget)
+            create_mondo_clinvar_relationships(cursor, date)
+            cursor.execute('DELETE FROM parsed_submissions WHERE date=?', [date])
+            if partitioned and previous_date:
+                remove_release(cursor, previous_date)
+            set_import_stage(cursor, date, filename, 'imported')
+            db.commit()
+
+    if partitioned:
+        if previous_date:
+            db.execute('VACUUM') #give back the space of the previous release
+        add_partition(date, database, filename)
     db.close()
 
 if __name__ == '__main__':
-    if len(argv) < 2:
-        print('Usage: ./import-clinvar-xml.py ClinVarFullRelease_<year>-<month>.xml ...')
-        exit()
+    parser = ArgumentParser(description='Import ClinVar full release XML files into the ClinVar Miner database.')
+    parser.add_argument('filenames', nargs='+', metavar='ClinVarFullRelease_<year>-<month>.xml[.gz]')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='only parse the ClinVarSets that changed since the previous release and carry the rest forward'
+    )
+    parser.add_argument(
+        '--temporal', action='store_true',
+        help='when creating the database, store each version of a submission once instead of once per release'
+        ' (releases must then be imported in chronological order)'
+    )
+    parser.add_argument(
+        '--partitioned', action='store_true',
+        help='when creating the database, store each release in a file of its own and list them in clinvar.db'
+    )
+    parser.add_argument(
+        '--workers', type=int,
+        help='number of processes that parse and compare the submissions'
+        ' (default: one per core, or as many as the memory budget can hold if that is fewer)'
+    )
+    parser.add_argument(
+        '--memory-budget', type=int, metavar='MIB',
+        help='memory that the workers and the batches in flight may take up'
+        ' (default: half of the memory that is available)'
+    )
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='skip the releases that have already been imported and pick up interrupted imports where they stopped'
+    )
+    args = parser.parse_args()
 
-    create_tables()
-    for filename in argv[1:]:
-        import_file(filename)
+    create_tables(args.temporal, args.partitioned)
+    for filename in args.filenames:
+        import_file(filename, args.incremental, args.workers, args.memory_budget and args.memory_budget * 1024 * 1024, args.resume)
@@ -1,9 +1,11 @@
 #!/bin/bash
+#stop at the first failure, so that make does not publish a database whose import failed
+set -e
 
-filename=ClinVarFullRelease_00-latest.xml
-url=https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/$filename.gz
+filename=ClinVarFullRelease_00-latest.xml.gz
+url=https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/$filename
 
 echo Downloading $url
-curl $url | gunzip > $filename 2> /dev/null
-./import-clinvar-xml.py $filename
+curl -f $url > $filename 2> /dev/null
+./import-clinvar-xml.py --incremental $filename
 echo
@@ -0,0 +1,20 @@
+from os import sysconf
+from resource import RUSAGE_SELF, getrusage
+
+def get_available_memory():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return sysconf('SC_AVPHYS_PAGES') * sysconf('SC_PAGE_SIZE')
+
+def get_private_memory():
+    #the memory that only this process uses, leaving out the pages that a forked worker still shares with its parent
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            return sum(int(line.split()[1]) * 1024 for line in f if line.split()[0] in ['Private_Clean:', 'Private_Dirty:'])
+    except OSError:
+        return getrusage(RUSAGE_SELF).ru_maxrss * 1024 #the peak, which also counts the shared pages
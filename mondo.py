@@ -1,19 +1,65 @@
 #!/usr/bin/python3
 
+from os import getpid, replace, stat
 from xml.etree import ElementTree
+import pickle
 
 def iri_to_mondo_xref(iri):
     if not iri or not iri.startswith('http://purl.obolibrary.org/obo/MONDO_'):
         return None
     return 'MONDO:' + iri[len('http://purl.obolibrary.org/obo/MONDO_'):]
 
-class Mondo:
-    xref_to_mondo_xref = {}
-    name_to_mondo_xref = {}
-    mondo_xref_to_name = {}
-    parents_by_mondo_xref = {}
+def read_top_level_elements(path):
+    #stream the file instead of building a tree of all of it, and let go of each element once it has been read
+    depth = 0
+    for event, el in ElementTree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if depth == 0:
+                root = el
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                yield el
+                root.clear()
 
+class Mondo:
     def __init__(self, path_to_mondo_owl = 'mondo.owl'):
+        #parsing the ontology takes much longer than loading the result of the last parse, which is kept next to it
+        #until a different version of the ontology is downloaded
+        owl_stat = stat(path_to_mondo_owl)
+        version = (owl_stat.st_size, owl_stat.st_mtime_ns)
+        compiled_path = path_to_mondo_owl + '.pickle'
+        try:
+            with open(compiled_path, 'rb') as f:
+                compiled = pickle.load(f)
+            if compiled['version'] == version:
+                self.__dict__.update(compiled['mondo'])
+                return
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            pass
+
+        self.parse(path_to_mondo_owl)
+
+        #every ancestor of every term is found once, so that looking them up later does not walk the ontology again
+        self.ancestors_by_mondo_xref = {}
+        for mondo_xref in self.parents_by_mondo_xref:
+            self.collect_ancestors(mondo_xref)
+
+        try:
+            temp_path = compiled_path + '.' + str(getpid())
+            with open(temp_path, 'wb') as f:
+                pickle.dump({'version': version, 'mondo': self.__dict__}, f, pickle.HIGHEST_PROTOCOL)
+            replace(temp_path, compiled_path) #other imports may be loading the last version right now
+        except OSError:
+            pass
+
+    def parse(self, path_to_mondo_owl):
+        self.xref_to_mondo_xref = {}
+        self.name_to_mondo_xref = {}
+        self.mondo_xref_to_name = {}
+        self.parents_by_mondo_xref = {}
+
         ns = {
             'oboInOwl': 'http://www.geneontology.org/formats/oboInOwl#',
             'owl': 'http://www.w3.org/2002/07/owl#',
@@ -21,8 +67,9 @@ class Mondo:
             'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
         }
 
-        root = ElementTree.parse(path_to_mondo_owl)
-        for class_el in root.findall('./owl:Class', ns):
+        for class_el in read_top_level_elements(path_to_mondo_owl):
+            if class_el.tag != '{http://www.w3.org/2002/07/owl#}Class':
+                continue
             if '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about' not in class_el.attrib:
                 continue
             mondo_xref = iri_to_mondo_xref(class_el.attrib['{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about'])
@@ -57,14 +104,17 @@ class Mondo:
                         self.parents_by_mondo_xref[mondo_xref] = []
                     self.parents_by_mondo_xref[mondo_xref].append(parent_xref)
 
-            del class_el #conserve memory
+    def collect_ancestors(self, xref):
+        if xref not in self.ancestors_by_mondo_xref:
+            ret = set()
+            for parent in self.parents_by_mondo_xref.get(xref, []):
+                ret.add(parent)
+                ret |= self.collect_ancestors(parent)
+            self.ancestors_by_mondo_xref[xref] = frozenset(ret)
+        return self.ancestors_by_mondo_xref[xref]
 
     def ancestors(self, xref):
-        parents = self.parents_by_mondo_xref.get(xref, [])
-        ret = set(parents)
-        for parent in parents:
-            ret |= self.ancestors(parent)
-        return ret
+        return self.ancestors_by_mondo_xref.get(xref, frozenset())
 
     def matches(self, condition_name, xrefs):
         ret = set()
@@ -80,12 +130,7 @@ class Mondo:
         return ret
 
     def is_descendent_of(self, descendent_xref, ancestor_xref):
-        if descendent_xref not in self.parents_by_mondo_xref:
-            return False #term has no parents
-        for parent_xref in self.parents_by_mondo_xref[descendent_xref]:
-            if parent_xref == ancestor_xref or self.is_descendent_of(parent_xref, ancestor_xref):
-                return True
-        return False
+        return ancestor_xref in self.ancestors(descendent_xref)
 
     def most_specific_matches(self, condition_name, xrefs):
         matches = list(self.matches(condition_name, xrefs))